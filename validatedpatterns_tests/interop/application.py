@@ -1,13 +1,20 @@
 import logging
+import time
 
 from ocp_resources.route import Route
 
-from . import __loggername__
+from . import __loggername__, resource_util, wait
 from .crd import ArgoCD
-from .edge_util import get_long_live_bearer_token, get_site_response
+from .edge_util import (
+    get_long_live_bearer_token,
+    get_site_response,
+    invalidate_bearer_token,
+)
 
 logger = logging.getLogger(__loggername__)
 
+ARGOCD_API_VERSION = f"{ArgoCD.api_group}/{ArgoCD.api_version}"
+
 
 def get_site_api_url(kube_config):
     hub_api_url = kube_config.host
@@ -19,11 +26,14 @@ def get_site_api_url(kube_config):
         return hub_api_url
 
 
-def get_site_api_response(openshift_dyn_client, site_api_url, project, sub_string):
+def get_site_api_response(
+    openshift_dyn_client, site_api_url, project, sub_string, cache=None
+):
     bearer_token = get_long_live_bearer_token(
         dyn_client=openshift_dyn_client,
         namespace=project,
         sub_string=sub_string,
+        cache=cache,
     )
 
     if not bearer_token:
@@ -36,6 +46,24 @@ def get_site_api_response(openshift_dyn_client, site_api_url, project, sub_strin
         site_url=site_api_url, bearer_token=bearer_token
     )
 
+    if site_api_response is not None and site_api_response.status_code == 401:
+        logger.info(f"Bearer token for {sub_string} was rejected, fetching it again")
+        invalidate_bearer_token(
+            openshift_dyn_client, namespace=project, sub_string=sub_string
+        )
+        if cache is not None:
+            cache.invalidate(kind="Secret", namespace=project)
+        bearer_token = get_long_live_bearer_token(
+            dyn_client=openshift_dyn_client,
+            namespace=project,
+            sub_string=sub_string,
+            cache=cache,
+        )
+        if bearer_token:
+            site_api_response = get_site_response(
+                site_url=site_api_url, bearer_token=bearer_token
+            )
+
     return site_api_response
 
 
@@ -56,22 +84,179 @@ def get_argocd_route_url(openshift_dyn_client, project, name):
     return final_argocd_url
 
 
-def get_argocd_application_status(openshift_dyn_client, projects):
+class ArgoCDApplicationStatus(object):
+    """
+    Compact status record of an ArgoCD application
+    """
+
+    __slots__ = (
+        "name",
+        "namespace",
+        "health",
+        "sync",
+        "operation_phase",
+        "unhealthy_resources",
+    )
+
+    def __init__(
+        self, name, namespace, health, sync, operation_phase, unhealthy_resources
+    ):
+        self.name = name
+        self.namespace = namespace
+        self.health = health
+        self.sync = sync
+        self.operation_phase = operation_phase
+        self.unhealthy_resources = unhealthy_resources
+
+    @classmethod
+    def from_dict(cls, app):
+        status = app.get("status") or {}
+        unhealthy_resources = tuple(
+            (
+                res.get("kind"),
+                res.get("namespace"),
+                res.get("name"),
+                (res.get("health") or {}).get("status"),
+                res.get("status"),
+            )
+            for res in status.get("resources") or []
+            if (res.get("health") and res["health"].get("status") != "Healthy")
+            or res.get("status") != "Synced"
+        )
+        return cls(
+            app["metadata"]["name"],
+            app["metadata"]["namespace"],
+            (status.get("health") or {}).get("status"),
+            (status.get("sync") or {}).get("status"),
+            (status.get("operationState") or {}).get("phase"),
+            unhealthy_resources,
+        )
+
+    @property
+    def healthy(self):
+        return self.health == "Healthy" and self.sync == "Synced"
+
+    def to_dict(self):
+        return {
+            "metadata": {"name": self.name, "namespace": self.namespace},
+            "status": {
+                "health": {"status": self.health},
+                "sync": {"status": self.sync},
+                "operationState": {"phase": self.operation_phase},
+                "resources": [
+                    {
+                        "kind": kind,
+                        "namespace": namespace,
+                        "name": name,
+                        "health": {"status": health},
+                        "status": sync,
+                    }
+                    for kind, namespace, name, health, sync in self.unhealthy_resources
+                ],
+            },
+        }
+
+
+def list_argocd_applications(
+    openshift_dyn_client, projects=None, limit=500, cache=None
+):
+    """
+    List the ArgoCD applications of all namespaces with a single paginated
+    query and project them into compact status records
+    :param projects: (list) only keep the applications of these namespaces,
+    None for all namespaces
+    :param limit: (int) page size
+    :param cache: (ResourceCache) reuse the cached cluster-wide application
+    list instead of listing them
+    :return: (list) ArgoCDApplicationStatus records
+    """
+    if cache is not None:
+        items = (app.to_dict() for app in cache.list("Application", ARGOCD_API_VERSION))
+    else:
+        api = resource_util.get_resource_api(
+            openshift_dyn_client, kind="Application", api_version=ARGOCD_API_VERSION
+        )
+        items = resource_util.iter_raw_items(api, limit=limit)
+
+    return [
+        record
+        for record in map(ArgoCDApplicationStatus.from_dict, items)
+        if projects is None or record.namespace in projects
+    ]
+
+
+def check_argocd_application_records(records, collector=None):
+    unhealthy_apps = []
+
+    for record in records:
+        logger.info(f"Status for {record.name} : {record.health} : {record.sync}")
+
+        if not record.healthy:
+            unhealthy_apps.append(record.name)
+            if collector:
+                collector.add_argocd_application(record.to_dict())
+                continue
+
+            logger.info(f"Dumping failed resources for app: {record.name}")
+            if not record.unhealthy_resources:
+                logger.info(f"No resources found for app: {record.name}")
+            for res in record.unhealthy_resources:
+                logger.info(f"\n{res}")
+
+    if collector:
+        collector.collect()
+
+    return unhealthy_apps
+
+
+def get_argocd_application_status(
+    openshift_dyn_client, projects, collector=None, cache=None, cluster_wide=False
+):
+    """
+    Log the health and sync status of the ArgoCD applications
+    :param projects: (list) namespaces of the applications
+    :param collector: (DiagnosticsCollector) queue unhealthy applications and
+    write their failed resources into artifact files instead of the log
+    :param cache: (ResourceCache) reuse cached application lists
+    :param cluster_wide: (bool) list the applications of all namespaces with
+    a single paginated query into compact status records
+    :return: (list) names of the unhealthy applications
+    """
+    if cluster_wide:
+        return check_argocd_application_records(
+            list_argocd_applications(openshift_dyn_client, projects, cache=cache),
+            collector,
+        )
+
     unhealthy_apps = []
 
     for project in projects:
-        for app in ArgoCD.get(dyn_client=openshift_dyn_client, namespace=project):
-            app_name = app.instance.metadata.name
-            app_health = app.instance.status.health.status
-            app_sync = app.instance.status.sync.status
+        if cache is not None:
+            apps = cache.list("Application", ARGOCD_API_VERSION, project)
+        else:
+            apps = (
+                app.instance
+                for app in ArgoCD.get(
+                    dyn_client=openshift_dyn_client, namespace=project
+                )
+            )
+
+        for app in apps:
+            app_name = app.metadata.name
+            app_health = app.status.health.status
+            app_sync = app.status.sync.status
 
             logger.info(f"Status for {app_name} : {app_health} : {app_sync}")
 
             if "Healthy" != app_health or "Synced" != app_sync:
-                logger.info(f"Dumping failed resources for app: {app_name}")
                 unhealthy_apps.append(app_name)
+                if collector:
+                    collector.add_argocd_application(app)
+                    continue
+
+                logger.info(f"Dumping failed resources for app: {app_name}")
                 try:
-                    for res in app.instance.status.resources:
+                    for res in app.status.resources:
                         if (
                             res.health and res.health.status != "Healthy"
                         ) or res.status != "Synced":
@@ -79,4 +264,103 @@ def get_argocd_application_status(openshift_dyn_client, projects):
                 except TypeError:
                     logger.info(f"No resources found for app: {app_name}")
 
+    if collector:
+        collector.collect()
+
     return unhealthy_apps
+
+
+def wait_for_argocd_applications(
+    openshift_dyn_client,
+    projects=None,
+    applications=None,
+    timeout=1800,
+    app_timeout=None,
+    fail_fast=True,
+):
+    """
+    Watch ArgoCD applications until all of them are Healthy and Synced.
+    Health, sync and operation phase transitions of every application are
+    logged as they happen.
+    :param projects: (list) namespaces of the applications, None for all
+    :param applications: (list) names of the applications to wait for, defaults
+    to all the applications of the projects, including the ones created during
+    the wait. The wait is not done before at least one application is found.
+    :param timeout: (int) overall time budget in seconds
+    :param app_timeout: (int) time budget of a single application in seconds,
+    counted from when it is first seen
+    :param fail_fast: (bool) fail as soon as an application is Degraded
+    :return: None on success, (False, err_msg) otherwise
+    """
+    records = {}
+    first_seen = {}
+    targets = set(applications or [])
+
+    def pending():
+        return sorted(
+            name for name in targets if name not in records or not records[name].healthy
+        )
+
+    def match(obj):
+        return (not applications or obj.metadata.name in targets) and (
+            projects is None or obj.metadata.namespace in projects
+        )
+
+    def progress(event_type, obj, objects):
+        record = ArgoCDApplicationStatus.from_dict(obj.to_dict())
+        if event_type == "DELETED":
+            records.pop(record.name, None)
+            if not applications:
+                targets.discard(record.name)
+            return
+
+        targets.add(record.name)
+
+        previous = records.get(record.name)
+        state = (record.health, record.sync, record.operation_phase)
+        if previous is None:
+            first_seen[record.name] = time.time()
+            logger.info(f"Application {record.name} : {state}")
+        elif (previous.health, previous.sync, previous.operation_phase) != state:
+            logger.info(f"Application {record.name} changed to : {state}")
+        records[record.name] = record
+
+    def fail(objects):
+        if fail_fast:
+            for record in records.values():
+                if record.health == "Degraded":
+                    logger.error(f"{record.name}: {record.unhealthy_resources}")
+                    return f"Application {record.name} is Degraded"
+
+        if app_timeout:
+            expired = [
+                name
+                for name in pending()
+                if name in first_seen and time.time() - first_seen[name] > app_timeout
+            ]
+            if expired:
+                return f"Applications not healthy within {app_timeout}s: {expired}"
+
+    result = wait.wait_for(
+        openshift_dyn_client,
+        "Application",
+        lambda objects: bool(targets) and not pending(),
+        api_version=ARGOCD_API_VERSION,
+        match=match,
+        fail=fail,
+        progress=progress,
+        timeout=timeout,
+        max_interval=min(app_timeout, 60) if app_timeout else 60,
+    )
+    if result:
+        logger.info("PASS: All applications are Healthy and Synced")
+        return
+
+    err_msg = result.error
+    if result.timed_out:
+        if targets:
+            err_msg = f"Applications not healthy within {timeout}s: {pending()}"
+        else:
+            err_msg = f"No applications were found within {timeout}s"
+    logger.error(f"FAIL: {err_msg}")
+    return False, err_msg
@@ -0,0 +1,92 @@
+"""
+Asyncio variants of the top level validators. The blocking checks run in the
+event loop executor and keep the return conventions of the wrapped
+functions, e.g.
+
+    results = run_validations(
+        validate_site_reachable(kube_config, openshift_dyn_client),
+        validate_argocd_reachable(openshift_dyn_client),
+        check_pod_status(openshift_dyn_client, projects),
+        get_argocd_application_status(openshift_dyn_client, projects),
+        subscription_status(openshift_dyn_client, expected_subs, diff=False),
+    )
+"""
+
+import asyncio
+import functools
+import logging
+
+from . import __loggername__, application, components, subscription
+
+logger = logging.getLogger(__loggername__)
+
+DEFAULT_CONCURRENCY = 8
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function in the event loop executor
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+async def validate_site_reachable(*args, **kwargs):
+    return await run_blocking(components.validate_site_reachable, *args, **kwargs)
+
+
+async def validate_argocd_reachable(*args, **kwargs):
+    return await run_blocking(components.validate_argocd_reachable, *args, **kwargs)
+
+
+async def check_pod_status(*args, **kwargs):
+    return await run_blocking(components.check_pod_status, *args, **kwargs)
+
+
+async def get_argocd_application_status(*args, **kwargs):
+    return await run_blocking(
+        application.get_argocd_application_status, *args, **kwargs
+    )
+
+
+async def subscription_status(*args, **kwargs):
+    return await run_blocking(subscription.subscription_status, *args, **kwargs)
+
+
+async def gather_validations(
+    *validations, limit=DEFAULT_CONCURRENCY, return_exceptions=False
+):
+    """
+    Run validations concurrently, at most limit at a time
+    :param validations: coroutines of the validators in this module
+    :param limit: (int) maximum number of validations running at once
+    :param return_exceptions: (bool) return exceptions, e.g. failed asserts,
+    as results instead of raising the first one
+    :return: (list) results in the order of the validations
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(validation):
+        async with semaphore:
+            return await validation
+
+    return await asyncio.gather(
+        *(bounded(validation) for validation in validations),
+        return_exceptions=return_exceptions,
+    )
+
+
+def run_validations(*validations, limit=DEFAULT_CONCURRENCY, return_exceptions=False):
+    """
+    Run validations concurrently from synchronous code, see gather_validations
+    :return: (list) results in the order of the validations
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            gather_validations(
+                *validations, limit=limit, return_exceptions=return_exceptions
+            )
+        )
+    finally:
+        loop.close()
@@ -0,0 +1,160 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+from . import __loggername__
+
+logger = logging.getLogger(__loggername__)
+
+OPERATOR_VERSIONS_REPO = "git@gitlab.cee.redhat.com:mpqe/mps/vp/operator-versions.git"
+
+
+def get_baseline_store():
+    """
+    Create the operator versions baseline store configured by the environment.
+    OPERATOR_VERSIONS_STORE selects a local directory, or a SQLite database
+    when the path ends with .db or .sqlite. Otherwise the git repository in
+    OPERATOR_VERSIONS_REPO is checked out into ./operator-versions.
+    :return: baseline store
+    """
+    store_path = os.getenv("OPERATOR_VERSIONS_STORE")
+    if store_path:
+        if store_path.endswith((".db", ".sqlite")):
+            return SQLiteBaselineStore(store_path)
+        return LocalBaselineStore(store_path)
+
+    return GitBaselineStore(
+        os.getenv("OPERATOR_VERSIONS_REPO", OPERATOR_VERSIONS_REPO),
+        os.path.join(os.getcwd(), "operator-versions"),
+    )
+
+
+class LocalBaselineStore(object):
+    """
+    Baseline files in a local directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, key):
+        """
+        :param key: (str) name of the baseline
+        :return: (list) baseline lines, None if the baseline does not exist
+        """
+        try:
+            with open(os.path.join(self.path, key)) as baseline:
+                return baseline.readlines()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, lines):
+        """
+        Atomically replace the baseline
+        :param key: (str) name of the baseline
+        :param lines: (list) baseline lines
+        """
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{key}.")
+        try:
+            with os.fdopen(fd, "w") as baseline:
+                baseline.writelines(lines)
+                baseline.flush()
+                os.fsync(baseline.fileno())
+            os.replace(tmp_path, os.path.join(self.path, key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def publish(self, key, message):
+        """
+        Make a written baseline available to other runs
+        """
+        pass
+
+
+class SQLiteBaselineStore(object):
+    """
+    Baselines in a SQLite database
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS baselines "
+                "(key TEXT PRIMARY KEY, content TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return contextlib.closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def read(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT content FROM baselines WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0].splitlines(keepends=True)
+
+    def write(self, key, lines):
+        with self._connect() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO baselines (key, content, updated) "
+                "VALUES (?, ?, ?)",
+                (key, "".join(lines), time.time()),
+            )
+
+    def publish(self, key, message):
+        pass
+
+
+class GitBaselineStore(LocalBaselineStore):
+    """
+    Baseline files in a git repository. An existing checkout is updated with a
+    shallow fetch instead of being cloned again.
+    """
+
+    def __init__(self, repo_url, checkout_dir, depth=1):
+        super(GitBaselineStore, self).__init__(checkout_dir)
+        self.repo_url = repo_url
+        self.depth = depth
+        self._synced = False
+
+    def _git(self, *args, **kwargs):
+        result = subprocess.run(
+            ["git"] + list(args), capture_output=True, text=True, **kwargs
+        )
+        logger.info(result.stdout)
+        logger.info(result.stderr)
+        return result
+
+    def sync(self):
+        if self._synced:
+            return
+
+        depth = f"--depth={self.depth}"
+        if os.path.isdir(os.path.join(self.path, ".git")):
+            logger.info(f"Update operator-versions checkout in {self.path}")
+            fetch = self._git("fetch", depth, "origin", "HEAD", cwd=self.path)
+            if fetch.returncode == 0:
+                self._git("reset", "--hard", "FETCH_HEAD", cwd=self.path)
+        else:
+            logger.info("Clone operator-versions repo")
+            self._git("clone", depth, self.repo_url, self.path)
+        self._synced = True
+
+    def read(self, key):
+        self.sync()
+        return super(GitBaselineStore, self).read(key)
+
+    def publish(self, key, message):
+        logger.info("Push new operator list")
+        self._git("add", key, cwd=self.path)
+        self._git("commit", "-m", message, cwd=self.path)
+        self._git("push", "origin", "HEAD", cwd=self.path)
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+from . import __loggername__, resource_util
+
+logger = logging.getLogger(__loggername__)
+
+
+class ResourceCache(object):
+    """
+    Session wide cache of list results of the dynamic client, keyed by kind,
+    namespace and selectors. Read-only checks that run back to back reuse the
+    same snapshot instead of querying the API server again.
+    """
+
+    def __init__(self, dyn_client, ttl=60):
+        """
+        :param dyn_client: (DynamicClient) openshift dynamic client
+        :param ttl: (int) seconds a list result is reused, None never expires
+        """
+        self.dyn_client = dyn_client
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, items = entry
+        if self.ttl is not None and time.time() - created > self.ttl:
+            del self._entries[key]
+            return None
+        return items
+
+    def list(
+        self,
+        kind,
+        api_version,
+        namespace=None,
+        label_selector=None,
+        field_selector=None,
+    ):
+        """
+        List resources, reusing a cached result of the same query or of the
+        same query across all namespaces
+        :param kind: (str) resource kind
+        :param api_version: (str) api version of the kind
+        :param namespace: (str) namespace, None for all namespaces
+        :param label_selector: (str) label selector
+        :param field_selector: (str) field selector
+        :return: (list) resource instances
+        """
+        key = (kind, api_version, namespace, label_selector, field_selector)
+        cluster_key = (kind, api_version, None, label_selector, field_selector)
+        with self._lock:
+            items = self._lookup(key)
+            if items is None and namespace is not None:
+                cluster_items = self._lookup(cluster_key)
+                if cluster_items is not None:
+                    items = [
+                        item
+                        for item in cluster_items
+                        if item.metadata.namespace == namespace
+                    ]
+        if items is not None:
+            return items
+
+        selectors = {}
+        if label_selector:
+            selectors["label_selector"] = label_selector
+        if field_selector:
+            selectors["field_selector"] = field_selector
+        api = resource_util.get_resource_api(
+            self.dyn_client, kind=kind, api_version=api_version
+        )
+        items = api.get(namespace=namespace, **selectors).items
+        logger.debug(f"Cached {len(items)} {kind} in namespace {namespace}")
+
+        with self._lock:
+            self._entries[key] = (time.time(), items)
+        return items
+
+    def invalidate(self, kind=None, namespace=None):
+        """
+        Drop cached list results
+        :param kind: (str) only drop results of this kind
+        :param namespace: (str) only drop results of this namespace and of
+        all namespaces
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if kind is not None and key[0] != kind:
+                    continue
+                if namespace is not None and key[2] not in (namespace, None):
+                    continue
+                del self._entries[key]
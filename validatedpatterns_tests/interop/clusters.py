@@ -0,0 +1,109 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import __loggername__
+from .discovery import DISCOVERY_CACHE_TTL, new_dynamic_client
+
+logger = logging.getLogger(__loggername__)
+
+
+def get_cluster_name(dyn_client):
+    """
+    :param dyn_client: (DynamicClient) openshift dynamic client
+    :return: (str) name of a client created by a ClusterRegistry, None
+    otherwise
+    """
+    return getattr(dyn_client, "cluster_name", None)
+
+
+def parse_cluster_options(values):
+    """
+    Parse NAME=KUBECONFIG[:CONTEXT] cluster options
+    :param values: (list) cluster options
+    :return: (dict) (kubeconfig, context) by cluster name
+    """
+    kubeconfigs = {}
+    for value in values or []:
+        name, sep, location = value.partition("=")
+        if not sep or not name or not location:
+            raise ValueError(
+                f"Invalid cluster '{value}', expected NAME=KUBECONFIG[:CONTEXT]"
+            )
+        kubeconfig, _, context = location.partition(":")
+        kubeconfigs[name] = (kubeconfig, context or None)
+
+    return kubeconfigs
+
+
+class ClusterRegistry(object):
+    """
+    Dynamic clients of several clusters, created on first use and sharing the
+    on-disk API discovery cache, to run checks on all clusters in parallel.
+    """
+
+    def __init__(self, kubeconfigs, cache_dir=None, ttl=DISCOVERY_CACHE_TTL):
+        """
+        :param kubeconfigs: (dict) (kubeconfig, context) by cluster name
+        :param cache_dir: (str) API discovery cache directory
+        :param ttl: (int) maximum age of the API discovery cache in seconds
+        """
+        self.kubeconfigs = dict(kubeconfigs)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._clients = {}
+        self._locks = {name: threading.Lock() for name in self.kubeconfigs}
+
+    @property
+    def names(self):
+        return list(self.kubeconfigs)
+
+    def set_client(self, name, client):
+        """
+        Register an already created dynamic client. The client is shared with
+        other callers and is left unnamed, its artifacts keep their location.
+        """
+        self._locks.setdefault(name, threading.Lock())
+        self.kubeconfigs.setdefault(name, (None, None))
+        self._clients[name] = client
+
+    def get_client(self, name):
+        """
+        :param name: (str) cluster name
+        :return: (DynamicClient) dynamic client of the cluster
+        """
+        with self._locks[name]:
+            if name not in self._clients:
+                kubeconfig, context = self.kubeconfigs[name]
+                logger.info(f"Create dynamic client for cluster {name}")
+                client = new_dynamic_client(
+                    kubeconfig, context=context, cache_dir=self.cache_dir, ttl=self.ttl
+                )
+                # Artifacts of the client are written per cluster
+                client.cluster_name = name
+                self._clients[name] = client
+        return self._clients[name]
+
+    def fan_out(self, func, *args, clusters=None, max_workers=None, **kwargs):
+        """
+        Run func(dyn_client, *args, **kwargs) on every cluster in parallel,
+        e.g. registry.fan_out(components.check_pod_status, projects)
+        :param func: check taking the dynamic client as first argument
+        :param clusters: (list) cluster names, defaults to all clusters
+        :param max_workers: (int) number of clusters checked at once
+        :return: (dict) results by cluster name. The exception is returned as
+        the result of a cluster where the check raised.
+        """
+        clusters = clusters or self.names
+
+        def run(name):
+            try:
+                return func(self.get_client(name), *args, **kwargs)
+            except Exception as e:
+                logger.error(f"Check {func.__name__} failed on cluster {name}: {e}")
+                return e
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or len(clusters) or 1
+        ) as executor:
+            return dict(zip(clusters, executor.map(run, clusters)))
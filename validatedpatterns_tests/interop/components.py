@@ -1,10 +1,14 @@
+import json
 import logging
 import os
 import re
-import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import yaml
 
+from kubernetes.client import CoreV1Api
+from kubernetes.client.rest import ApiException
 from ocp_resources.namespace import Namespace
 from ocp_resources.pipeline import Pipeline
 from ocp_resources.pipelineruns import PipelineRun
@@ -12,7 +16,13 @@ from ocp_resources.task_run import TaskRun
 from ocp_resources.pod import Pod
 from openshift.dynamic.exceptions import NotFoundError
 
-from validatedpatterns_tests.interop import application
+from validatedpatterns_tests.interop import (
+    application,
+    instrumentation,
+    resource_util,
+    wait,
+)
+from validatedpatterns_tests.interop.clusters import get_cluster_name
 from validatedpatterns_tests.interop.crd import ManagedCluster
 
 from . import __loggername__
@@ -21,21 +31,191 @@ logger = logging.getLogger(__loggername__)
 
 oc = os.environ["HOME"] + "/oc_client/oc"
 
+PIPELINERUN_PENDING_REASONS = (None, "Running", "Started", "Pending")
+
+MANAGED_CLUSTER_CONDITIONS = (
+    "HubAcceptedManagedCluster",
+    "ManagedClusterJoined",
+    "ManagedClusterConditionAvailable",
+)
+
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+LOG_CHUNK_SIZE = 64 * 1024
+LOG_LIMIT_BYTES = 10 * 1024 * 1024
+TASKRUN_LOG_LIMIT_BYTES = 2 * 1024 * 1024
+
 
 def dump_openshift_version():
-    version_out = subprocess.run(["oc", "version"], capture_output=True)
+    version_out = instrumentation.run_command(["oc", "version"], capture_output=True)
     version_out = version_out.stdout.decode("utf-8")
     return version_out
 
 
 def dump_pvc():
-    pvcs_out = subprocess.run(["oc", "get", "pvc", "-A"], capture_output=True)
+    pvcs_out = instrumentation.run_command(
+        ["oc", "get", "pvc", "-A"], capture_output=True
+    )
     pvcs_out = pvcs_out.stdout.decode("utf-8")
     return pvcs_out
 
 
-def describe_pod(project, pod):
-    cmd_out = subprocess.run(
+def get_events(openshift_dyn_client, project, name, kind="Pod"):
+    api = resource_util.get_resource_api(
+        openshift_dyn_client, kind="Event", api_version="v1"
+    )
+    events = api.get(
+        namespace=project,
+        field_selector=f"involvedObject.kind={kind},involvedObject.name={name}",
+    )
+    events = [event.to_dict() for event in events.items]
+
+    return sorted(
+        events,
+        key=lambda event: event.get("lastTimestamp") or event.get("eventTime") or "",
+    )
+
+
+def get_pod_report(openshift_dyn_client, project, pod):
+    """
+    Collect the pod spec, status, container states and related events
+    :param project: (str) namespace of the pod
+    :param pod: (str) name of the pod
+    :return: (dict) pod report
+    """
+    api = resource_util.get_resource_api(
+        openshift_dyn_client, kind="Pod", api_version="v1"
+    )
+    pod_obj = api.get(name=pod, namespace=project).to_dict()
+    spec = pod_obj.get("spec") or {}
+    status = pod_obj.get("status") or {}
+
+    images = {
+        container["name"]: container.get("image")
+        for container in (spec.get("initContainers") or [])
+        + (spec.get("containers") or [])
+    }
+    containers = []
+    for container in (status.get("initContainerStatuses") or []) + (
+        status.get("containerStatuses") or []
+    ):
+        containers.append(
+            {
+                "name": container["name"],
+                "image": images.get(container["name"], container.get("image")),
+                "ready": container.get("ready"),
+                "restartCount": container.get("restartCount"),
+                "state": container.get("state") or {},
+                "lastState": container.get("lastState") or {},
+            }
+        )
+
+    return {
+        "name": pod,
+        "namespace": project,
+        "node": spec.get("nodeName"),
+        "phase": status.get("phase"),
+        "reason": status.get("reason"),
+        "message": status.get("message"),
+        "conditions": [
+            {
+                "type": condition.get("type"),
+                "status": condition.get("status"),
+                "reason": condition.get("reason"),
+            }
+            for condition in status.get("conditions") or []
+        ],
+        "containers": containers,
+        "events": [
+            {
+                "type": event.get("type"),
+                "reason": event.get("reason"),
+                "count": event.get("count"),
+                "lastTimestamp": event.get("lastTimestamp") or event.get("eventTime"),
+                "message": event.get("message"),
+            }
+            for event in get_events(openshift_dyn_client, project, pod)
+        ],
+    }
+
+
+def format_container_state(state):
+    if not state:
+        return "-"
+    name, details = next(iter(state.items()))
+    details = details or {}
+    text = name.capitalize()
+    if details.get("reason"):
+        text += f" ({details['reason']})"
+    if details.get("exitCode") is not None:
+        text += f" exit code {details['exitCode']}"
+    if details.get("message"):
+        text += f": {details['message']}"
+    return text
+
+
+def format_pod_report(report):
+    lines = [
+        f"Name:         {report['name']}",
+        f"Namespace:    {report['namespace']}",
+        f"Node:         {report['node']}",
+        f"Status:       {report['phase']}",
+    ]
+    if report["reason"] or report["message"]:
+        lines.append(f"Reason:       {report['reason']} {report['message'] or ''}")
+
+    lines.append("Conditions:")
+    for condition in report["conditions"]:
+        lines.append(
+            f"  {condition['type']}: {condition['status']}"
+            f" {condition['reason'] or ''}".rstrip()
+        )
+
+    lines.append("Containers:")
+    for container in report["containers"]:
+        lines.extend(
+            [
+                f"  {container['name']}:",
+                f"    Image:          {container['image']}",
+                f"    State:          {format_container_state(container['state'])}",
+                f"    Last State:     {format_container_state(container['lastState'])}",
+                f"    Ready:          {container['ready']}",
+                f"    Restart Count:  {container['restartCount']}",
+            ]
+        )
+
+    lines.append("Events:")
+    if not report["events"]:
+        lines.append("  <none>")
+    for event in report["events"]:
+        lines.append(
+            f"  {event['lastTimestamp']}  {event['type']}  {event['reason']}"
+            f" (x{event['count'] or 1})  {event['message']}"
+        )
+
+    return "\n".join(lines)
+
+
+def describe_pod(project, pod, openshift_dyn_client=None, output="text"):
+    """
+    Describe a pod for failure diagnostics
+    :param project: (str) namespace of the pod
+    :param pod: (str) name of the pod
+    :param openshift_dyn_client: (DynamicClient) when given, the pod is
+    described in-process through the API instead of running `oc describe`
+    :param output: (str) "text" or "json" report for the in-process describe
+    :return: (str) pod description
+    """
+    if openshift_dyn_client is not None:
+        try:
+            report = get_pod_report(openshift_dyn_client, project, pod)
+        except NotFoundError as e:
+            assert False, e
+        if output == "json":
+            return json.dumps(report, indent=2, default=str)
+        return format_pod_report(report)
+
+    cmd_out = instrumentation.run_command(
         [oc, "describe", "pod", "-n", project, pod], capture_output=True
     )
     if cmd_out.stdout:
@@ -45,7 +225,7 @@ def describe_pod(project, pod):
 
 
 def get_log_output(project, pod, container):
-    cmd_out = subprocess.run(
+    cmd_out = instrumentation.run_command(
         [oc, "logs", "-n", project, pod, "-c", container], capture_output=True
     )
     if cmd_out.stdout:
@@ -54,6 +234,85 @@ def get_log_output(project, pod, container):
         assert False, cmd_out.stderr
 
 
+def stream_log_output(
+    openshift_dyn_client,
+    project,
+    pod,
+    container,
+    artifact_dir=None,
+    tail_lines=None,
+    limit_bytes=LOG_LIMIT_BYTES,
+    since_seconds=None,
+    previous=False,
+    excerpt_lines=20,
+):
+    """
+    Stream a container log through the pod log API into an artifact file and
+    log only its path and last lines
+    :param project: (str) namespace of the pod
+    :param pod: (str) name of the pod
+    :param container: (str) name of the container
+    :param artifact_dir: (str) directory of the log file, defaults to pod_logs
+    under LOG_DIR, in a directory per cluster for the clients of a
+    ClusterRegistry
+    :param tail_lines: (int) number of lines from the end of the log
+    :param limit_bytes: (int) maximum number of bytes to capture
+    :param since_seconds: (int) only capture the log of the last seconds
+    :param previous: (bool) capture the log of the previous container instance
+    :param excerpt_lines: (int) number of last lines written to the logger
+    :return: (str) path of the log file, None if the log is not available
+    """
+    if artifact_dir is None:
+        from .conftest_logger import LOG_DIR
+
+        artifact_dir = os.path.join(
+            LOG_DIR, "pod_logs", get_cluster_name(openshift_dyn_client) or ""
+        )
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    suffix = "_previous" if previous else ""
+    log_path = os.path.join(artifact_dir, f"{project}_{pod}_{container}{suffix}.log")
+
+    params = {"container": container, "previous": previous}
+    if tail_lines is not None:
+        params["tail_lines"] = tail_lines
+    if limit_bytes is not None:
+        params["limit_bytes"] = limit_bytes
+    if since_seconds is not None:
+        params["since_seconds"] = since_seconds
+
+    try:
+        response = CoreV1Api(openshift_dyn_client.client).read_namespaced_pod_log(
+            pod, project, _preload_content=False, **params
+        )
+    except ApiException as e:
+        logger.info(f"Log of {pod}/{container} in {project} is not available: {e}")
+        return None
+
+    written = 0
+    tail = b""
+    try:
+        with open(log_path, "wb") as log_file:
+            for chunk in response.stream(LOG_CHUNK_SIZE):
+                if limit_bytes is not None:
+                    chunk = chunk[: limit_bytes - written]
+                log_file.write(chunk)
+                written += len(chunk)
+                tail = (tail + chunk)[-LOG_CHUNK_SIZE:]
+                if limit_bytes is not None and written >= limit_bytes:
+                    break
+    finally:
+        response.release_conn()
+
+    excerpt = tail.decode("utf-8", errors="replace").splitlines()[-excerpt_lines:]
+    logger.info(
+        f"Log of {pod}/{container}{suffix} in {project} ({written} bytes) written"
+        f" to {log_path}, last lines:\n" + "\n".join(excerpt)
+    )
+
+    return log_path
+
+
 def check_project_absence(openshift_dyn_client, projects):
     missing_projects = []
 
@@ -69,9 +328,49 @@ def check_project_absence(openshift_dyn_client, projects):
     return missing_projects
 
 
-def check_pod_absence(openshift_dyn_client, project):
+def get_namespace_names(openshift_dyn_client, cache=None):
+    namespaces = resource_util.list_resources(
+        openshift_dyn_client, "Namespace", "v1", cache=cache
+    )
+    return {namespace.metadata.name for namespace in namespaces}
+
+
+def get_pod_snapshot(openshift_dyn_client, projects=None, cache=None):
+    """
+    List pods once and index them by namespace
+    :param projects: (list) namespaces listed one by one, None lists the pods
+    of all namespaces with a single call
+    :param cache: (ResourceCache) reuse cached pod lists
+    :return: (dict) lists of pod instances by namespace
+    """
+    if projects is None:
+        listings = [
+            resource_util.list_resources(openshift_dyn_client, "Pod", "v1", cache=cache)
+        ]
+    else:
+        listings = [
+            resource_util.list_resources(
+                openshift_dyn_client, "Pod", "v1", namespace=project, cache=cache
+            )
+            for project in projects
+        ]
+
+    pod_index = {project: [] for project in projects or []}
+    for listing in listings:
+        for pod in listing:
+            pod_index.setdefault(pod.metadata.namespace, []).append(pod)
+
+    return pod_index
+
+
+def check_pod_absence(openshift_dyn_client, project, pod_index=None):
     # Check for absence of pods in project
     missing_pods = []
+    if pod_index is not None:
+        if not pod_index.get(project):
+            missing_pods.append(project)
+        return missing_pods
+
     try:
         pods = Pod.get(dyn_client=openshift_dyn_client, namespace=project)
         next(pods)
@@ -80,62 +379,208 @@ def check_pod_absence(openshift_dyn_client, project):
     return missing_pods
 
 
-def check_pod_status(openshift_dyn_client, projects, skip_check=""):
-    missing_projects = check_project_absence(openshift_dyn_client, projects)
-    missing_pods = []
+def log_container_diagnostics(project, pod, container, openshift_dyn_client=None):
+    logger.info(describe_pod(project, pod, openshift_dyn_client))
+    if openshift_dyn_client is None:
+        logger.info(get_log_output(project, pod, container.name))
+        return
+
+    stream_log_output(openshift_dyn_client, project, pod, container.name)
+    if container.restartCount:
+        stream_log_output(
+            openshift_dyn_client, project, pod, container.name, previous=True
+        )
+
+
+def check_pods(project, pods, skip_check="", openshift_dyn_client=None, collector=None):
     failed_pods = []
-    err_msg = []
 
-    for project in projects:
-        logger.info(f"Checking pods in namespace '{project}'")
-        missing_pods += check_pod_absence(openshift_dyn_client, project)
-        pods = Pod.get(dyn_client=openshift_dyn_client, namespace=project)
-        for pod in pods:
-            flag = ""
-            if skip_check:
-                for skip in skip_check:
-                    if skip in pod.instance.metadata.name:
-                        logger.info(f"Skipping: {pod.instance.metadata.name}")
-                        flag = "skipped"
-                        break
-
-            if flag == "skipped":
-                continue
+    for pod in pods:
+        pod_extra = {"namespace": project, "kind": "Pod", "resource": pod.metadata.name}
+        flag = ""
+        if skip_check:
+            for skip in skip_check:
+                if skip in pod.metadata.name:
+                    logger.info(f"Skipping: {pod.metadata.name}", extra=pod_extra)
+                    flag = "skipped"
+                    break
 
-            for container in pod.instance.status.containerStatuses:
-                logger.info(
-                    f"{pod.instance.metadata.name} : {container.name} :"
-                    f" {container.state}"
-                )
-                if container.state.terminated:
-                    if container.state.terminated.reason != "Completed":
-                        logger.info(
-                            f"Pod {pod.instance.metadata.name} in"
-                            f" {pod.instance.metadata.namespace} namespace is"
-                            " FAILED:"
-                        )
-                        failed_pods.append(pod.instance.metadata.name)
-                        logger.info(describe_pod(project, pod.instance.metadata.name))
-                        logger.info(
-                            get_log_output(
-                                project,
-                                pod.instance.metadata.name,
-                                container.name,
-                            )
-                        )
-                elif not container.state.running:
+        if flag == "skipped":
+            continue
+
+        for container in pod.status.containerStatuses:
+            logger.info(
+                f"{pod.metadata.name} : {container.name} : {container.state}",
+                extra=pod_extra,
+            )
+            if container.state.terminated:
+                if container.state.terminated.reason != "Completed":
                     logger.info(
-                        f"Pod {pod.instance.metadata.name} in"
-                        f" {pod.instance.metadata.namespace} namespace is"
-                        " FAILED:"
+                        f"Pod {pod.metadata.name} in"
+                        f" {pod.metadata.namespace} namespace is"
+                        " FAILED:",
+                        extra=pod_extra,
                     )
-                    failed_pods.append(pod.instance.metadata.name)
-                    logger.info(describe_pod(project, pod.instance.metadata.name))
-                    logger.info(
-                        get_log_output(
-                            project, pod.instance.metadata.name, container.name
+                    failed_pods.append(pod.metadata.name)
+                    if collector:
+                        collector.add_pod(
+                            project,
+                            pod.metadata.name,
+                            container.name,
+                            container.restartCount,
                         )
+                    else:
+                        log_container_diagnostics(
+                            project, pod.metadata.name, container, openshift_dyn_client
+                        )
+            elif not container.state.running:
+                logger.info(
+                    f"Pod {pod.metadata.name} in"
+                    f" {pod.metadata.namespace} namespace is"
+                    " FAILED:",
+                    extra=pod_extra,
+                )
+                failed_pods.append(pod.metadata.name)
+                if collector:
+                    collector.add_pod(
+                        project,
+                        pod.metadata.name,
+                        container.name,
+                        container.restartCount,
                     )
+                else:
+                    log_container_diagnostics(
+                        project, pod.metadata.name, container, openshift_dyn_client
+                    )
+
+    return failed_pods
+
+
+def check_project_pods(
+    openshift_dyn_client,
+    project,
+    skip_check="",
+    pod_index=None,
+    native_diagnostics=True,
+    collector=None,
+):
+    start = time.time()
+    logger.info(
+        f"Checking pods in namespace '{project}'",
+        extra={"namespace": project, "kind": "Pod"},
+    )
+    missing_pods = check_pod_absence(openshift_dyn_client, project, pod_index)
+    if pod_index is not None:
+        pods = pod_index.get(project, [])
+    else:
+        pods = [
+            pod.instance
+            for pod in Pod.get(dyn_client=openshift_dyn_client, namespace=project)
+        ]
+    failed_pods = check_pods(
+        project,
+        pods,
+        skip_check,
+        openshift_dyn_client if native_diagnostics else None,
+        collector,
+    )
+    logger.info(
+        f"Checked {len(pods)} pods in namespace '{project}'",
+        extra={"namespace": project, "kind": "Pod", "duration": time.time() - start},
+    )
+
+    return missing_pods, failed_pods
+
+
+def check_pod_status(
+    openshift_dyn_client,
+    projects,
+    skip_check="",
+    concurrency=1,
+    snapshot=None,
+    native_diagnostics=True,
+    collector=None,
+    cache=None,
+):
+    """
+    Check that every project exists, has pods deployed and that no container
+    is failed. Diagnostics are logged for every failed container.
+    :param projects: (list) namespaces to check
+    :param skip_check: (list) substrings of pod names to skip
+    :param concurrency: (int) number of namespaces checked in parallel
+    :param snapshot: (str) "cluster" to list the pods of all namespaces with a
+    single call, "namespace" to list them once per namespace. Namespaces and
+    pods are then checked against that snapshot instead of being queried per
+    check.
+    :param native_diagnostics: (bool) describe failed pods and stream their
+    logs into artifact files through the API, False runs the oc client
+    :param collector: (DiagnosticsCollector) queue failed pods and collect
+    their diagnostics concurrently into artifact files once all namespaces
+    are checked
+    :param cache: (ResourceCache) reuse cached namespace and pod lists for the
+    snapshot
+    :return: None on success, (False, err_msg) otherwise
+    """
+    missing_pods = []
+    failed_pods = []
+    err_msg = []
+
+    pod_index = None
+    if snapshot:
+        namespace_names = get_namespace_names(openshift_dyn_client, cache)
+        missing_projects = [
+            project for project in projects if project not in namespace_names
+        ]
+        pod_index = get_pod_snapshot(
+            openshift_dyn_client, None if snapshot == "cluster" else projects, cache
+        )
+
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if not snapshot:
+                missing_projects = sum(
+                    executor.map(
+                        lambda project: check_project_absence(
+                            openshift_dyn_client, [project]
+                        ),
+                        projects,
+                    ),
+                    [],
+                )
+            results = list(
+                executor.map(
+                    lambda project: check_project_pods(
+                        openshift_dyn_client,
+                        project,
+                        skip_check,
+                        pod_index,
+                        native_diagnostics,
+                        collector,
+                    ),
+                    projects,
+                )
+            )
+    else:
+        if not snapshot:
+            missing_projects = check_project_absence(openshift_dyn_client, projects)
+        results = [
+            check_project_pods(
+                openshift_dyn_client,
+                project,
+                skip_check,
+                pod_index,
+                native_diagnostics,
+                collector,
+            )
+            for project in projects
+        ]
+
+    for project_missing_pods, project_failed_pods in results:
+        missing_pods += project_missing_pods
+        failed_pods += project_failed_pods
+
+    if collector:
+        collector.collect()
 
     if missing_projects:
         err_msg.append(f"The following namespaces are missing: {missing_projects}")
@@ -154,13 +599,13 @@ def check_pod_status(openshift_dyn_client, projects, skip_check=""):
         return None
 
 
-def validate_site_reachable(kube_config, openshift_dyn_client):
+def validate_site_reachable(kube_config, openshift_dyn_client, cache=None):
     namespace = "openshift-gitops"
     sub_string = "argocd-dex-server-token"
 
     api_url = application.get_site_api_url(kube_config)
     api_response = application.get_site_api_response(
-        openshift_dyn_client, api_url, namespace, sub_string
+        openshift_dyn_client, api_url, namespace, sub_string, cache
     )
 
     logger.info(f"Site API response : {api_response}")
@@ -172,7 +617,7 @@ def validate_site_reachable(kube_config, openshift_dyn_client):
         return None
 
 
-def validate_argocd_reachable(openshift_dyn_client):
+def validate_argocd_reachable(openshift_dyn_client, cache=None):
     namespace = "openshift-gitops"
     name = "openshift-gitops-server"
     sub_string = "argocd-dex-server-token"
@@ -182,7 +627,7 @@ def validate_argocd_reachable(openshift_dyn_client):
             openshift_dyn_client, namespace, name
         )
         argocd_route_response = application.get_site_api_response(
-            openshift_dyn_client, argocd_route_url, namespace, sub_string
+            openshift_dyn_client, argocd_route_url, namespace, sub_string, cache
         )
     except StopIteration:
         err_msg = "Argocd url/route is missing in open-cluster-management namespace"
@@ -197,8 +642,78 @@ def validate_argocd_reachable(openshift_dyn_client):
         return None
 
 
-def validate_acm_self_registration_managed_clusters(openshift_dyn_client, kubefiles):
+def get_kubeconfig_site_name(kubefile):
+    kubefile_exp = os.path.expandvars(kubefile)
+    with open(kubefile_exp) as stream:
+        try:
+            out = yaml.load(stream, Loader=YAML_LOADER)
+            return out["clusters"][0]["name"]
+        except yaml.YAMLError:
+            err_msg = "Failed to load kubeconfig file"
+            assert False, err_msg
+
+
+def get_managed_clusters_report(
+    openshift_dyn_client, kubefiles, max_workers=8, cache=None
+):
+    """
+    Evaluate the registration of the managed clusters of all kubeconfig files
+    from a single ManagedCluster listing
+    :param kubefiles: (list) kubeconfig files of the managed clusters
+    :param max_workers: (int) number of kubeconfig files parsed concurrently
+    :param cache: (ResourceCache) reuse a cached ManagedCluster list
+    :return: (dict) registration report by site name
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        site_names = list(executor.map(get_kubeconfig_site_name, kubefiles))
+
+    clusters = {
+        cluster.metadata.name: cluster
+        for cluster in resource_util.list_resources(
+            openshift_dyn_client,
+            "ManagedCluster",
+            ManagedCluster.api_version,
+            cache=cache,
+        )
+    }
+
+    report = {}
+    for site_name in site_names:
+        cluster = clusters.get(site_name)
+        conditions = {}
+        if cluster is not None and cluster.status:
+            conditions = {
+                condition.type: condition.status
+                for condition in cluster.status.conditions or []
+            }
+        report[site_name] = {
+            "found": cluster is not None,
+            "conditions": {
+                condition_type: conditions.get(condition_type)
+                for condition_type in MANAGED_CLUSTER_CONDITIONS
+            },
+            "joined": all(
+                conditions.get(condition_type) == "True"
+                for condition_type in MANAGED_CLUSTER_CONDITIONS
+            ),
+        }
+
+    return report
+
+
+def validate_acm_self_registration_managed_clusters(
+    openshift_dyn_client, kubefiles, batched=False
+):
     err_msg = []
+
+    if batched:
+        report = get_managed_clusters_report(openshift_dyn_client, kubefiles)
+        for site_name, site_report in report.items():
+            logger.info(f"Managed Cluster {site_name} : {site_report}")
+            if not site_report["joined"]:
+                err_msg.append(f"{site_name} is not self registered")
+
+        return err_msg or None
     for kubefile in kubefiles:
         kubefile_exp = os.path.expandvars(kubefile)
         with open(kubefile_exp) as stream:
@@ -224,9 +739,211 @@ def validate_acm_self_registration_managed_clusters(openshift_dyn_client, kubefi
     return err_msg
 
 
+def get_pipelinerun_reason(pipelinerun):
+    conditions = pipelinerun.status.conditions if pipelinerun.status else None
+    if not conditions:
+        return None
+    return conditions[0].reason
+
+
+def wait_for_pipelineruns(
+    openshift_dyn_client, project, expected_pipelineruns, timeout=3600
+):
+    """
+    Watch pipeline runs in a namespace until a run was found for every expected
+    pipeline run and all of them finished, or until timeout expires
+    :param project: (str) namespace of the pipeline runs
+    :param expected_pipelineruns: (list) regular expressions of pipeline run names
+    :param timeout: (int) time budget in seconds
+    :return: (tuple) lists of found, passed and failed pipeline run names
+    """
+    states = {}
+
+    # Do not wait for pipeline runs that were never started
+    api = resource_util.get_resource_api(
+        openshift_dyn_client, kind="PipelineRun", group="tekton.dev"
+    )
+    if not api.get(namespace=project, limit=1).items:
+        logger.info(f"No pipeline runs were found in {project}")
+        return [], [], []
+
+    def match(pipelinerun):
+        return any(
+            re.search(expected, pipelinerun.metadata.name)
+            for expected in expected_pipelineruns
+        )
+
+    def progress(event_type, pipelinerun, pipelineruns):
+        name = pipelinerun.metadata.name
+        if event_type == "DELETED":
+            states.pop(name, None)
+            return
+
+        reason = get_pipelinerun_reason(pipelinerun)
+        extra = {"namespace": project, "kind": "PipelineRun", "resource": name}
+        if name not in states:
+            logger.info(f"found pipelinerun: {name}", extra=extra)
+        if states.get(name) != reason:
+            logger.info(f"Pipeline run {name} : {reason}", extra=extra)
+        states[name] = reason
+
+    def condition(pipelineruns):
+        all_found = all(
+            any(re.search(expected, found) for found in states)
+            for expected in expected_pipelineruns
+        )
+        return all_found and not any(
+            state in PIPELINERUN_PENDING_REASONS for state in states.values()
+        )
+
+    wait.wait_for(
+        openshift_dyn_client,
+        "PipelineRun",
+        condition,
+        group="tekton.dev",
+        namespace=project,
+        match=match,
+        progress=progress,
+        timeout=timeout,
+    )
+
+    found_pipelineruns = list(states)
+    passed_pipelineruns = [
+        name for name, reason in states.items() if reason == "Succeeded"
+    ]
+    failed_pipelineruns = [
+        name
+        for name, reason in states.items()
+        if reason not in PIPELINERUN_PENDING_REASONS and reason != "Succeeded"
+    ]
+    return found_pipelineruns, passed_pipelineruns, failed_pipelineruns
+
+
+def get_failed_taskruns(openshift_dyn_client, project, pipelineruns):
+    """
+    Get the failed task runs of pipeline runs with their pod and step
+    containers
+    :param project: (str) namespace of the pipeline runs
+    :param pipelineruns: (list) names of the pipeline runs
+    :return: (list) tuples of task run name, pod name and step container names
+    """
+    if not pipelineruns:
+        return []
+
+    api = resource_util.get_resource_api(
+        openshift_dyn_client, kind="TaskRun", group="tekton.dev"
+    )
+    taskruns = api.get(
+        namespace=project,
+        label_selector=f"tekton.dev/pipelineRun in ({','.join(pipelineruns)})",
+    ).items
+
+    failed_taskruns = []
+    for taskrun in taskruns:
+        taskrun = taskrun.to_dict()
+        status = taskrun.get("status") or {}
+        conditions = status.get("conditions") or []
+        if not conditions or conditions[0].get("status") != "False":
+            continue
+
+        name = taskrun["metadata"]["name"]
+        extra = {"namespace": project, "kind": "TaskRun", "resource": name}
+        logger.info(
+            f"Task FAILED: {name} Reason: {conditions[0].get('reason')}", extra=extra
+        )
+        logger.info(f"message: {conditions[0].get('message')}", extra=extra)
+
+        pod = status.get("podName")
+        if not pod:
+            logger.error(f"No pod to collect logs from for task run {name}")
+            continue
+        containers = [
+            step.get("container") or f"step-{step.get('name')}"
+            for step in status.get("steps") or []
+        ]
+        failed_taskruns.append((name, pod, containers))
+
+    return failed_taskruns
+
+
+def collect_taskrun_logs(
+    openshift_dyn_client,
+    project,
+    pipelineruns,
+    artifact_dir=None,
+    limit_bytes=TASKRUN_LOG_LIMIT_BYTES,
+    max_workers=8,
+):
+    """
+    Stream the step logs of the failed task runs of pipeline runs in parallel
+    into artifact files
+    :param project: (str) namespace of the pipeline runs
+    :param pipelineruns: (list) names of the pipeline runs
+    :param artifact_dir: (str) directory of the log files, defaults to
+    taskrun_logs under LOG_DIR, in a directory per cluster for the clients
+    of a ClusterRegistry
+    :param limit_bytes: (int) maximum number of bytes captured per step
+    :param max_workers: (int) number of logs streamed at once
+    :return: (dict) log file paths by task run name
+    """
+    if artifact_dir is None:
+        from .conftest_logger import LOG_DIR
+
+        artifact_dir = os.path.join(
+            LOG_DIR, "taskrun_logs", get_cluster_name(openshift_dyn_client) or ""
+        )
+
+    steps = [
+        (name, pod, container)
+        for name, pod, containers in get_failed_taskruns(
+            openshift_dyn_client, project, pipelineruns
+        )
+        for container in containers
+    ]
+
+    def stream(step):
+        name, pod, container = step
+        return stream_log_output(
+            openshift_dyn_client,
+            project,
+            pod,
+            container,
+            artifact_dir=artifact_dir,
+            limit_bytes=limit_bytes,
+        )
+
+    taskrun_logs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for (name, _, _), log_path in zip(steps, executor.map(stream, steps)):
+            taskrun_logs.setdefault(name, [])
+            if log_path:
+                taskrun_logs[name].append(log_path)
+
+    return taskrun_logs
+
+
 def validate_pipelineruns(
-    openshift_dyn_client, project, expected_pipelines, expected_pipelineruns
+    openshift_dyn_client,
+    project,
+    expected_pipelines,
+    expected_pipelineruns,
+    watch=False,
+    timeout=3600,
+    native_diagnostics=True,
 ):
+    """
+    Check that the expected pipelines exist and their pipeline runs succeed
+    :param project: (str) namespace of the pipelines
+    :param expected_pipelines: (list) names of the expected pipelines
+    :param expected_pipelineruns: (list) regular expressions of pipeline run names
+    :param watch: (bool) watch the pipeline runs instead of polling them
+    :param timeout: (int) time budget in seconds
+    :param native_diagnostics: (bool) stream the step logs of the failed task
+    runs of the unsuccessful pipeline runs through the API, False runs the
+    oc logs command of the failed task run messages
+    :return: None on success, (False, err_msg) otherwise
+    """
+    start = time.time()
     found_pipelines = []
     found_pipelineruns = []
     passed_pipelineruns = []
@@ -245,7 +962,14 @@ def validate_pipelineruns(
             match = expected_pipeline + "$"
             if re.match(match, pipeline.instance.metadata.name):
                 if pipeline.instance.metadata.name not in found_pipelines:
-                    logger.info(f"found pipeline: {pipeline.instance.metadata.name}")
+                    logger.info(
+                        f"found pipeline: {pipeline.instance.metadata.name}",
+                        extra={
+                            "namespace": project,
+                            "kind": "Pipeline",
+                            "resource": pipeline.instance.metadata.name,
+                        },
+                    )
                     found_pipelines.append(pipeline.instance.metadata.name)
                     break
 
@@ -255,9 +979,6 @@ def validate_pipelineruns(
         err_msg = f"Some or all pipelines are missing:\nExpected: {expected_pipelines}\nFound: {found_pipelines}"
         return False, err_msg
 
-    logger.info("Checking Openshift pipeline runs")
-    timeout = time.time() + 3600
-
     # FAIL here if no pipelineruns are found
     try:
         pipelineruns = PipelineRun.get(
@@ -268,70 +989,141 @@ def validate_pipelineruns(
         err_msg = "No pipeline runs were found"
         return False, err_msg
 
-    while time.time() < timeout:
-        for pipelinerun in PipelineRun.get(
-            dyn_client=openshift_dyn_client, namespace=project
-        ):
-            for expected_pipelinerun in expected_pipelineruns:
-                if re.search(expected_pipelinerun, pipelinerun.instance.metadata.name):
-                    if pipelinerun.instance.metadata.name not in found_pipelineruns:
-                        logger.info(
-                            f"found pipelinerun: {pipelinerun.instance.metadata.name}"
-                        )
-                        found_pipelineruns.append(pipelinerun.instance.metadata.name)
-                        break
-
-        if len(expected_pipelineruns) == len(found_pipelineruns):
-            break
-        else:
-            time.sleep(60)
-            continue
+    if watch:
+        logger.info("Watching Openshift pipeline runs")
+        (
+            found_pipelineruns,
+            passed_pipelineruns,
+            failed_pipelineruns,
+        ) = wait_for_pipelineruns(
+            openshift_dyn_client, project, expected_pipelineruns, timeout=timeout
+        )
 
-    if len(expected_pipelineruns) == len(found_pipelineruns):
-        logger.info("Found all expected pipeline runs")
+        missing_pipelineruns = [
+            expected_pipelinerun
+            for expected_pipelinerun in expected_pipelineruns
+            if not any(
+                re.search(expected_pipelinerun, name) for name in found_pipelineruns
+            )
+        ]
+        if missing_pipelineruns:
+            err_msg = f"Some pipeline runs are missing:\nExpected: {expected_pipelineruns}\nFound: {found_pipelineruns}"
+            return False, err_msg
+
+        summary_extra = {
+            "namespace": project,
+            "kind": "PipelineRun",
+            "duration": time.time() - start,
+        }
+        logger.info(f"Failed pipelineruns: {failed_pipelineruns}", extra=summary_extra)
+        logger.info(f"Passed pipelineruns: {passed_pipelineruns}", extra=summary_extra)
     else:
-        err_msg = f"Some pipeline runs are missing:\nExpected: {expected_pipelineruns}\nFound: {found_pipelineruns}"
-        return False, err_msg
+        logger.info("Checking Openshift pipeline runs")
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            for pipelinerun in PipelineRun.get(
+                dyn_client=openshift_dyn_client, namespace=project
+            ):
+                for expected_pipelinerun in expected_pipelineruns:
+                    if re.search(
+                        expected_pipelinerun, pipelinerun.instance.metadata.name
+                    ):
+                        if pipelinerun.instance.metadata.name not in found_pipelineruns:
+                            logger.info(
+                                f"found pipelinerun: {pipelinerun.instance.metadata.name}",
+                                extra={
+                                    "namespace": project,
+                                    "kind": "PipelineRun",
+                                    "resource": pipelinerun.instance.metadata.name,
+                                },
+                            )
+                            found_pipelineruns.append(
+                                pipelinerun.instance.metadata.name
+                            )
+                            break
 
-    logger.info("Checking Openshift pipeline run status")
-    timeout = time.time() + 3600
+            if len(expected_pipelineruns) == len(found_pipelineruns):
+                break
+            else:
+                time.sleep(60)
+                continue
 
-    while time.time() < timeout:
-        for pipelinerun in PipelineRun.get(
-            dyn_client=openshift_dyn_client, namespace=project
-        ):
-            if pipelinerun.instance.status.conditions[0].reason == "Succeeded":
-                if pipelinerun.instance.metadata.name not in passed_pipelineruns:
+        if len(expected_pipelineruns) == len(found_pipelineruns):
+            logger.info("Found all expected pipeline runs")
+        else:
+            err_msg = f"Some pipeline runs are missing:\nExpected: {expected_pipelineruns}\nFound: {found_pipelineruns}"
+            return False, err_msg
+
+        logger.info("Checking Openshift pipeline run status")
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            for pipelinerun in PipelineRun.get(
+                dyn_client=openshift_dyn_client, namespace=project
+            ):
+                extra = {
+                    "namespace": project,
+                    "kind": "PipelineRun",
+                    "resource": pipelinerun.instance.metadata.name,
+                }
+                if pipelinerun.instance.status.conditions[0].reason == "Succeeded":
+                    if pipelinerun.instance.metadata.name not in passed_pipelineruns:
+                        logger.info(
+                            f"Pipeline run succeeded: {pipelinerun.instance.metadata.name}",
+                            extra=extra,
+                        )
+                        passed_pipelineruns.append(pipelinerun.instance.metadata.name)
+                elif pipelinerun.instance.status.conditions[0].reason == "Running":
                     logger.info(
-                        f"Pipeline run succeeded: {pipelinerun.instance.metadata.name}"
+                        f"Pipeline {pipelinerun.instance.metadata.name} is still running",
+                        extra=extra,
                     )
-                    passed_pipelineruns.append(pipelinerun.instance.metadata.name)
-            elif pipelinerun.instance.status.conditions[0].reason == "Running":
-                logger.info(
-                    f"Pipeline {pipelinerun.instance.metadata.name} is still running"
-                )
+                else:
+                    reason = pipelinerun.instance.status.conditions[0].reason
+                    logger.info(
+                        f"Pipeline run FAILED: {pipelinerun.instance.metadata.name} Reason: {reason}",
+                        extra=extra,
+                    )
+                    if pipelinerun.instance.metadata.name not in failed_pipelineruns:
+                        failed_pipelineruns.append(pipelinerun.instance.metadata.name)
+
+            summary_extra = {
+                "namespace": project,
+                "kind": "PipelineRun",
+                "duration": time.time() - start,
+            }
+            logger.info(
+                f"Failed pipelineruns: {failed_pipelineruns}", extra=summary_extra
+            )
+            logger.info(
+                f"Passed pipelineruns: {passed_pipelineruns}", extra=summary_extra
+            )
+
+            if (len(failed_pipelineruns) + len(passed_pipelineruns)) == len(
+                expected_pipelines
+            ):
+                break
             else:
-                reason = pipelinerun.instance.status.conditions[0].reason
-                logger.info(
-                    f"Pipeline run FAILED: {pipelinerun.instance.metadata.name} Reason: {reason}"
-                )
-                if pipelinerun.instance.metadata.name not in failed_pipelineruns:
-                    failed_pipelineruns.append(pipelinerun.instance.metadata.name)
-
-        logger.info(f"Failed pipelineruns: {failed_pipelineruns}")
-        logger.info(f"Passed pipelineruns: {passed_pipelineruns}")
-
-        if (len(failed_pipelineruns) + len(passed_pipelineruns)) == len(
-            expected_pipelines
-        ):
-            break
-        else:
-            time.sleep(60)
-            continue
+                time.sleep(60)
+                continue
 
     if ((len(failed_pipelineruns)) > 0) or (
         len(passed_pipelineruns) < len(expected_pipelineruns)
     ):
+        if native_diagnostics:
+            logger.info("Collecting logs of failed Openshift task runs")
+            unsuccessful_pipelineruns = sorted(
+                set(found_pipelineruns + failed_pipelineruns) - set(passed_pipelineruns)
+            )
+            if not collect_taskrun_logs(
+                openshift_dyn_client, project, unsuccessful_pipelineruns
+            ):
+                logger.info("No failed task runs were found")
+
+            err_msg = "Some or all tasks have failed"
+            return False, err_msg
+
         logger.info("Checking Openshift task runs")
 
         # FAIL here if no task runs are found
@@ -353,18 +1145,20 @@ def validate_pipelineruns(
                 message = taskrun.instance.status.conditions[0].message
                 logger.info(f"message: {message}")
 
-                try:
-                    cmdstring = re.search("for logs run: kubectl(.*)$", message).group(
-                        1
-                    )
-                    cmd = str(oc + cmdstring)
-                    logger.info(f"CMD: {cmd}")
-                    cmd_out = subprocess.run(cmd, shell=True, capture_output=True)
-
-                    logger.info(cmd_out.stdout.decode("utf-8"))
-                    logger.info(cmd_out.stderr.decode("utf-8"))
-                except AttributeError:
+                # Only the arguments of an oc logs command are taken from the
+                # message, it is never run by a shell
+                cmdstring = re.search("for logs run: kubectl(.*)$", message or "")
+                args = cmdstring.group(1).split() if cmdstring else []
+                if args[:1] != ["logs"]:
                     logger.error("No logs to collect")
+                    continue
+
+                cmd = [oc] + args
+                logger.info(f"CMD: {' '.join(cmd)}")
+                cmd_out = instrumentation.run_command(cmd, capture_output=True)
+
+                logger.info(cmd_out.stdout.decode("utf-8"))
+                logger.info(cmd_out.stderr.decode("utf-8"))
 
         err_msg = "Some or all tasks have failed"
         return False, err_msg
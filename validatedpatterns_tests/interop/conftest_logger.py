@@ -1,11 +1,27 @@
+import gzip
+import json
 import logging
 import os
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from logging.handlers import RotatingFileHandler
+from logging.handlers import (
+    MemoryHandler,
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+)
 
 import pytest
 
 from . import __loggername__
+from .current_test import get_current_test_name
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 if os.getenv("EXTERNAL_TEST") == "true":
     LOG_DIR = os.path.join(os.environ["WORKSPACE"], ".results/test_execution_logs")
@@ -16,9 +32,143 @@ else:
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR, exist_ok=True)
 
+# Write the log records from a background thread, file records in batches
+LOG_QUEUE = os.getenv("CSS_LOG_QUEUE") == "true"
+LOG_BATCH_SIZE = int(os.getenv("CSS_LOG_BATCH_SIZE", "100"))
+# Also write the log records as JSON lines
+LOG_JSON = os.getenv("CSS_LOG_JSON") == "true"
+# Compress rotated log files: gzip, zstd, or true for zstd when available
+LOG_COMPRESS = os.getenv("CSS_LOG_COMPRESS", "")
+LOG_MAX_BYTES = 1024 * 1024 * 1024
+LOG_BACKUP_COUNT = 20
+
+
+def get_compression():
+    """
+    :return: (str) compression of the rotated log files, None for none
+    """
+    compression = LOG_COMPRESS.lower()
+    if compression in ("", "false"):
+        return None
+    if compression in ("true", "zstd"):
+        return "zstd" if zstandard is not None else "gzip"
+    return "gzip"
+
+
+def compress_file(source, dest, compression):
+    tmp_dest = f"{dest}.tmp"
+    with open(source, "rb") as src:
+        if compression == "zstd":
+            with open(tmp_dest, "wb") as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+        else:
+            with gzip.open(tmp_dest, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_dest, dest)
+    os.remove(source)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler compressing the rotated files on a background thread
+    """
+
+    def __init__(self, filename, compression="gzip", **kwargs):
+        self.compression = compression
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        super(CompressedRotatingFileHandler, self).__init__(filename, **kwargs)
+        self.namer = self._compressed_name
+        self.rotator = self._rotate
+
+    def _compressed_name(self, name):
+        return name + (".zst" if self.compression == "zstd" else ".gz")
+
+    def _rotate(self, source, dest):
+        rotated = f"{source}.rotated"
+        os.rename(source, rotated)
+        self._pending = self._executor.submit(
+            compress_file, rotated, dest, self.compression
+        )
+
+    def wait(self):
+        """
+        Wait for the compression of the last rotated file
+        """
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def doRollover(self):
+        # The backups are renamed on rollover, the previous one must be done
+        self.wait()
+        super(CompressedRotatingFileHandler, self).doRollover()
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+        super(CompressedRotatingFileHandler, self).close()
+
+
+def new_file_handler(filepath):
+    """
+    :param filepath: (str) log file path
+    :return: (RotatingFileHandler) handler of the log file
+    """
+    compression = get_compression()
+    if compression:
+        return CompressedRotatingFileHandler(
+            filepath,
+            compression=compression,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+        )
+    return RotatingFileHandler(
+        filepath, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+    )
+
+
+class CurrentTestFilter(logging.Filter):
+    """
+    Attach the name of the running test to the records when they are logged
+    """
+
+    def filter(self, record):
+        record.test = get_current_test_name()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as JSON lines. The namespace, kind, resource and duration
+    fields are taken from the extra arguments of the log call, e.g.
+    logger.info("Pod ready", extra={"namespace": ns, "kind": "Pod"})
+    """
+
+    EXTRA_FIELDS = ("namespace", "kind", "resource", "duration")
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "test": getattr(record, "test", None) or get_current_test_name(),
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 
 class CSS_Logger(object):
     _logger = None
+    _listener = None
+    _queue_handler = None
 
     def __new__(cls, *args, **kwargs):
         if cls._logger is None:
@@ -27,18 +177,14 @@ class CSS_Logger(object):
             cls._logger = logging.getLogger(args[0])
             cls._logger.setLevel(logging.DEBUG)
 
-            pytest_current_test = os.environ.get("PYTEST_CURRENT_TEST")
-            split_test_name = pytest_current_test.split("::")[1]
-            short_test_name = split_test_name.split(" ")[0]
+            short_test_name = get_current_test_name()
 
             datestring = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
             filename = "{}_{}.log".format(short_test_name, datestring)
             filepath = os.path.join(LOG_DIR, filename)
 
             # Create a file handler for logging level above DEBUG
-            file_handler = RotatingFileHandler(
-                filepath, maxBytes=1024 * 1024 * 1024, backupCount=20
-            )
+            file_handler = new_file_handler(filepath)
 
             # Create a logging format
             log_formatter = logging.Formatter(
@@ -54,14 +200,70 @@ class CSS_Logger(object):
             stream_handler.setLevel(logging.INFO)
             stream_handler.setFormatter(log_formatter)
 
-            # Add the handlers to the logger
-            cls._logger.addHandler(file_handler)
-            cls._logger.addHandler(stream_handler)
+            file_handlers = [file_handler]
+            if LOG_JSON:
+                json_handler = new_file_handler(
+                    os.path.join(
+                        LOG_DIR, "{}_{}.jsonl".format(short_test_name, datestring)
+                    )
+                )
+                json_handler.setFormatter(JSONFormatter())
+                file_handlers.append(json_handler)
+            cls._logger.addFilter(CurrentTestFilter())
+
+            if LOG_QUEUE:
+                # Records are only enqueued on the logging thread, the
+                # listener thread formats and writes them
+                log_queue = queue.Queue(-1)
+                cls._listener = QueueListener(
+                    log_queue,
+                    *[
+                        MemoryHandler(
+                            LOG_BATCH_SIZE, flushLevel=logging.ERROR, target=handler
+                        )
+                        for handler in file_handlers
+                    ],
+                    stream_handler,
+                    respect_handler_level=True,
+                )
+                cls._listener.start()
+                cls._queue_handler = QueueHandler(log_queue)
+                cls._logger.addHandler(cls._queue_handler)
+            else:
+                # Add the handlers to the logger
+                for handler in file_handlers + [stream_handler]:
+                    cls._logger.addHandler(handler)
 
         return cls._logger
 
+    @classmethod
+    def flush(cls):
+        """
+        Write the queued log records and log directly from now on, and wait
+        for the compression of the rotated log files
+        """
+        if cls._listener is not None:
+            cls._stop_listener()
+
+        for handler in cls._logger.handlers if cls._logger else []:
+            if isinstance(handler, CompressedRotatingFileHandler):
+                handler.wait()
+
+    @classmethod
+    def _stop_listener(cls):
+        cls._listener.stop()
+        cls._logger.removeHandler(cls._queue_handler)
+        for handler in cls._listener.handlers:
+            handler.flush()
+            if isinstance(handler, MemoryHandler):
+                handler = handler.target
+            cls._logger.addHandler(handler)
+        cls._listener = None
+        cls._queue_handler = None
+
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_logger():
     logger = CSS_Logger(__loggername__)
-    return logger
+    yield logger
+    CSS_Logger.flush()
@@ -1,9 +1,16 @@
 import os
+from datetime import datetime
 
 import pytest
 from kubernetes import config
 from kubernetes.client import Configuration
-from openshift.dynamic import DynamicClient
+
+from .cache import ResourceCache
+from .clusters import ClusterRegistry, parse_cluster_options
+from .diagnostics import DiagnosticsCollector
+from .discovery import DISCOVERY_CACHE_TTL, new_dynamic_client
+from .instrumentation import recorder
+from .profiling import PROFILE_MODES, SessionProfiler
 
 
 def pytest_addoption(parser):
@@ -13,6 +20,107 @@ def pytest_addoption(parser):
         default=None,
         help="The full path to the kubeconfig file to be used",
     )
+    parser.addoption(
+        "--discovery-cache-dir",
+        action="store",
+        default=None,
+        help="Directory of the API discovery cache",
+    )
+    parser.addoption(
+        "--discovery-cache-ttl",
+        action="store",
+        type=int,
+        default=DISCOVERY_CACHE_TTL,
+        help="Maximum age of the API discovery cache in seconds",
+    )
+    parser.addoption(
+        "--cluster",
+        action="append",
+        default=[],
+        help="Additional cluster to validate as NAME=KUBECONFIG[:CONTEXT], "
+        "can be repeated. The name hub is reserved for the --kubeconfig cluster",
+    )
+    parser.addoption(
+        "--api-stats",
+        action="store_true",
+        default=False,
+        help="Record the API calls and oc commands of every test and report "
+        "them at the end of the session",
+    )
+    parser.addoption(
+        "--vp-profile",
+        action="store",
+        default=None,
+        choices=PROFILE_MODES,
+        help="Profile every test body by cpu or wall time into LOG_DIR/profiles. "
+        "The .prof files and the hottest functions only cover the test thread, "
+        "the sampled stacks cover all threads, weighted by their CPU time in "
+        "cpu mode",
+    )
+    parser.addoption(
+        "--vp-profile-top",
+        action="store",
+        type=int,
+        default=20,
+        help="Number of hottest functions reported with --vp-profile",
+    )
+
+
+def get_log_dir():
+    """
+    :return: (str) LOG_DIR of conftest_logger, the current directory when
+    WORKSPACE is not set
+    """
+    try:
+        from .conftest_logger import LOG_DIR
+    except KeyError:
+        # conftest_logger resolves LOG_DIR from WORKSPACE at import
+        return os.getcwd()
+    return LOG_DIR
+
+
+def pytest_configure(config):
+    recorder.enabled = config.getoption("--api-stats")
+
+    config.vp_profiler = None
+    if config.getoption("--vp-profile"):
+        config.vp_profiler = SessionProfiler(
+            config.getoption("--vp-profile"), os.path.join(get_log_dir(), "profiles")
+        )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    profiler = getattr(item.config, "vp_profiler", None)
+    if profiler is None:
+        yield
+        return
+
+    with profiler.profile(item.nodeid):
+        yield
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    profiler = getattr(config, "vp_profiler", None)
+    if profiler is not None:
+        collapsed_path = profiler.write_collapsed()
+        terminalreporter.write_sep("=", f"Profile ({profiler.mode} time)")
+        for line in profiler.format_top(config.getoption("--vp-profile-top")):
+            terminalreporter.write_line(line)
+        terminalreporter.write_line(f"Profiles: {profiler.profile_dir}")
+        terminalreporter.write_line(f"Collapsed stacks: {collapsed_path}")
+
+    if not recorder.enabled:
+        return
+
+    datestring = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+    summary_path = os.path.join(get_log_dir(), f"api_stats_{datestring}.json")
+    recorder.write_json(summary_path)
+
+    terminalreporter.write_sep("=", "API calls")
+    for line in recorder.format_table():
+        terminalreporter.write_line(line)
+    terminalreporter.write_line(f"Per test summary: {summary_path}")
 
 
 @pytest.fixture(scope="session")
@@ -38,5 +146,36 @@ def kube_config(get_kubeconfig):
 
 
 @pytest.fixture(scope="session")
-def openshift_dyn_client(get_kubeconfig):
-    return DynamicClient(client=config.new_client_from_config(get_kubeconfig))
+def openshift_dyn_client(request, get_kubeconfig):
+    return new_dynamic_client(
+        get_kubeconfig,
+        cache_dir=request.config.getoption("--discovery-cache-dir"),
+        ttl=request.config.getoption("--discovery-cache-ttl"),
+    )
+
+
+@pytest.fixture(scope="session")
+def cluster_registry(request, openshift_dyn_client):
+    kubeconfigs = parse_cluster_options(request.config.getoption("--cluster"))
+    if "hub" in kubeconfigs:
+        raise ValueError(
+            "The hub cluster is the one of --kubeconfig, use another name "
+            "than hub for --cluster"
+        )
+    registry = ClusterRegistry(
+        kubeconfigs,
+        cache_dir=request.config.getoption("--discovery-cache-dir"),
+        ttl=request.config.getoption("--discovery-cache-ttl"),
+    )
+    registry.set_client("hub", openshift_dyn_client)
+    return registry
+
+
+@pytest.fixture(scope="session")
+def resource_cache(openshift_dyn_client):
+    return ResourceCache(openshift_dyn_client)
+
+
+@pytest.fixture
+def diagnostics_collector(openshift_dyn_client):
+    return DiagnosticsCollector(openshift_dyn_client)
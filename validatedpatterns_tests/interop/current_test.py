@@ -0,0 +1,13 @@
+import os
+
+
+def get_current_test_name():
+    """
+    Short name of the running test, used to name its logs and artifacts
+    :return: (str) test name, session outside of tests
+    """
+    pytest_current_test = os.environ.get("PYTEST_CURRENT_TEST")
+    if not pytest_current_test:
+        return "session"
+    split_test_name = pytest_current_test.split("::")[1]
+    return split_test_name.split(" ")[0]
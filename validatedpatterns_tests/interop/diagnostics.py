@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from . import __loggername__
+from .clusters import get_cluster_name
+from .components import describe_pod, get_events, stream_log_output
+
+logger = logging.getLogger(__loggername__)
+
+
+class DiagnosticsCollector(object):
+    """
+    Queue failed pods, containers and ArgoCD applications and collect their
+    diagnostics concurrently into a per-test artifact directory with an
+    index.json file, instead of logging them inline.
+    """
+
+    def __init__(
+        self,
+        openshift_dyn_client,
+        base_dir=None,
+        max_workers=8,
+        budget_bytes=256 * 1024 * 1024,
+        log_limit_bytes=10 * 1024 * 1024,
+    ):
+        """
+        :param openshift_dyn_client: (DynamicClient) openshift dynamic client
+        :param base_dir: (str) parent of the artifact directory, defaults to
+        LOG_DIR. The artifact directory name starts with the cluster name for
+        the clients of a ClusterRegistry.
+        :param max_workers: (int) number of items collected in parallel
+        :param budget_bytes: (int) total size of the captured logs
+        :param log_limit_bytes: (int) maximum size of a single container log
+        """
+        from .conftest_logger import LOG_DIR, get_current_test_name
+
+        datestring = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        dirname = f"{get_current_test_name()}_{datestring}"
+        cluster_name = get_cluster_name(openshift_dyn_client)
+        if cluster_name:
+            dirname = f"{cluster_name}_{dirname}"
+        self.artifact_dir = os.path.join(base_dir or LOG_DIR, "diagnostics", dirname)
+        self.openshift_dyn_client = openshift_dyn_client
+        self.max_workers = max_workers
+        self.log_limit_bytes = log_limit_bytes
+        self.index = []
+
+        self._lock = threading.Lock()
+        self._remaining_bytes = budget_bytes
+        self._pods = {}
+        self._applications = []
+
+    def add_pod(self, project, pod, container=None, restart_count=0):
+        """
+        Queue a failed pod, optionally with one of its failed containers
+        """
+        with self._lock:
+            containers = self._pods.setdefault((project, pod), {})
+            if container:
+                containers[container] = restart_count
+
+    def add_argocd_application(self, app):
+        """
+        Queue an unhealthy ArgoCD application instance or dict
+        """
+        with self._lock:
+            self._applications.append(app if isinstance(app, dict) else app.to_dict())
+
+    def collect(self):
+        """
+        Collect the diagnostics of all queued items concurrently
+        :return: (str) path of the index file
+        """
+        with self._lock:
+            pods, self._pods = self._pods, {}
+            applications, self._applications = self._applications, []
+
+        tasks = []
+        for (project, pod), containers in pods.items():
+            tasks.append((self._collect_describe, project, pod))
+            for container, restart_count in containers.items():
+                tasks.append((self._collect_log, project, pod, container, False))
+                if restart_count:
+                    tasks.append((self._collect_log, project, pod, container, True))
+        for app in applications:
+            tasks.append((self._collect_application, app))
+
+        if not tasks:
+            return None
+
+        start = time.time()
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            entries = list(executor.map(self._run_task, tasks))
+
+        self.index += entries
+        index_path = os.path.join(self.artifact_dir, "index.json")
+        with open(index_path, "w") as index_file:
+            json.dump(self.index, index_file, indent=2)
+
+        logger.info(
+            f"Diagnostics of {len(pods)} pods and {len(applications)} applications"
+            f" written to {self.artifact_dir}",
+            extra={"duration": time.time() - start},
+        )
+        return index_path
+
+    def _run_task(self, task):
+        func, args = task[0], task[1:]
+        start = time.time()
+        try:
+            entry = func(*args)
+        except Exception as e:
+            logger.info(
+                f"Failed to collect diagnostics {args}: {e}",
+                extra={"duration": time.time() - start},
+            )
+            return {"task": func.__name__, "args": list(args), "error": str(e)}
+
+        logger.debug(
+            f"Collected {func.__name__[len('_collect_'):]} diagnostics",
+            extra={
+                "namespace": entry.get("namespace"),
+                "kind": entry.get("kind"),
+                "resource": entry.get("name"),
+                "duration": time.time() - start,
+            },
+        )
+        return entry
+
+    def _reserve_bytes(self, limit):
+        with self._lock:
+            granted = max(0, min(limit, self._remaining_bytes))
+            self._remaining_bytes -= granted
+        return granted
+
+    def _release_bytes(self, count):
+        with self._lock:
+            self._remaining_bytes += count
+
+    def _write(self, filename, content):
+        path = os.path.join(self.artifact_dir, filename)
+        with open(path, "w") as artifact:
+            artifact.write(content)
+        return path
+
+    def _collect_describe(self, project, pod):
+        path = self._write(
+            f"{project}_{pod}_describe.txt",
+            describe_pod(project, pod, self.openshift_dyn_client),
+        )
+        return {"kind": "Pod", "namespace": project, "name": pod, "describe": path}
+
+    def _collect_log(self, project, pod, container, previous):
+        entry = {
+            "kind": "Container",
+            "namespace": project,
+            "name": pod,
+            "container": container,
+            "previous": previous,
+            "log": None,
+        }
+        granted = self._reserve_bytes(self.log_limit_bytes)
+        if not granted:
+            entry["error"] = "Log size budget exhausted"
+            return entry
+
+        path = stream_log_output(
+            self.openshift_dyn_client,
+            project,
+            pod,
+            container,
+            artifact_dir=self.artifact_dir,
+            limit_bytes=granted,
+            previous=previous,
+        )
+        written = os.path.getsize(path) if path else 0
+        self._release_bytes(granted - written)
+        entry["log"] = path
+        return entry
+
+    def _collect_application(self, app):
+        namespace = app["metadata"]["namespace"]
+        name = app["metadata"]["name"]
+        status = app.get("status") or {}
+        report = {
+            "health": status.get("health"),
+            "sync": status.get("sync"),
+            "operationState": status.get("operationState"),
+            "conditions": status.get("conditions"),
+            "unhealthyResources": [
+                res
+                for res in status.get("resources") or []
+                if (res.get("health") and res["health"].get("status") != "Healthy")
+                or res.get("status") != "Synced"
+            ],
+            "events": get_events(
+                self.openshift_dyn_client, namespace, name, kind="Application"
+            ),
+        }
+        path = self._write(
+            f"argocd_{namespace}_{name}.json", json.dumps(report, indent=2, default=str)
+        )
+        return {
+            "kind": "Application",
+            "namespace": namespace,
+            "name": name,
+            "report": path,
+        }
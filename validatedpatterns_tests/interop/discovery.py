@@ -0,0 +1,67 @@
+import hashlib
+import logging
+import os
+import time
+
+from kubernetes import config
+from kubernetes.client import VersionApi
+from openshift.dynamic import DynamicClient
+
+from . import __loggername__, instrumentation
+
+logger = logging.getLogger(__loggername__)
+
+DISCOVERY_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "vp-qe-test-common", "discovery"
+)
+DISCOVERY_CACHE_TTL = 24 * 3600
+
+
+def get_discovery_cache_file(api_client, cache_dir=None, ttl=DISCOVERY_CACHE_TTL):
+    """
+    Get the API discovery cache file of a cluster, keyed by server url and
+    cluster version. A cache file older than ttl is removed so discovery is
+    done again. Kinds missing from a cached discovery are refreshed by the
+    dynamic client on lookup.
+    :param api_client: (ApiClient) kubernetes api client
+    :param cache_dir: (str) cache directory, defaults to DISCOVERY_CACHE_DIR
+    :param ttl: (int) maximum age of the cache file in seconds
+    :return: (str) cache file path
+    """
+    try:
+        version = VersionApi(api_client).get_code().git_version
+    except Exception as e:
+        logger.info(f"Failed to get the cluster version: {e}")
+        version = "unknown"
+
+    host = api_client.configuration.host
+    digest = hashlib.sha256(f"{host}|{version}".encode("utf-8")).hexdigest()[:16]
+    cache_dir = cache_dir or DISCOVERY_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"discovery-{digest}.json")
+
+    if os.path.exists(cache_file) and (
+        time.time() - os.path.getmtime(cache_file) > ttl
+    ):
+        logger.info(f"Discovery cache {cache_file} expired")
+        os.remove(cache_file)
+
+    return cache_file
+
+
+def new_dynamic_client(
+    kubeconfig, context=None, cache_dir=None, ttl=DISCOVERY_CACHE_TTL
+):
+    """
+    Create a dynamic client that reuses the on-disk API discovery cache
+    :param kubeconfig: (str) kubeconfig file path
+    :param context: (str) kubeconfig context, defaults to the current one
+    :param cache_dir: (str) discovery cache directory
+    :param ttl: (int) maximum age of the discovery cache in seconds
+    :return: (DynamicClient) openshift dynamic client
+    """
+    api_client = config.new_client_from_config(config_file=kubeconfig, context=context)
+    instrumentation.instrument_api_client(api_client)
+    cache_file = get_discovery_cache_file(api_client, cache_dir, ttl)
+
+    return DynamicClient(client=api_client, cache_file=cache_file)
@@ -3,17 +3,35 @@ import fileinput
 import logging
 import os
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import yaml
-from ocp_resources.secret import Secret
 from requests import HTTPError, RequestException
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning, ProtocolError
+from urllib3.util.retry import Retry
 
-from . import __loggername__
+from . import __loggername__, resource_util
 
 logger = logging.getLogger(__loggername__)
 
+# (connect, read) timeouts in seconds
+HTTP_TIMEOUT = (10, 60)
+HTTP_RETRIES = 3
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+SERVICE_ACCOUNT_TOKEN_TYPE = "kubernetes.io/service-account-token"
+PARTIAL_OBJECT_METADATA_LIST = (
+    "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+)
+
+_bearer_tokens = {}
+_bearer_tokens_lock = threading.Lock()
+
 
 def load_yaml_file(file_path):
     """
@@ -47,21 +65,87 @@ def find_number_of_edge_sites(dir_path):
     return site_names
 
 
-def get_long_live_bearer_token(
+def find_secret_name(dyn_client, namespace, sub_string):
+    """
+    Find the name of a secret through a metadata-only listing, looking at
+    service account token secrets first
+    :param namespace: (string) name of namespace where secret exist
+    :param sub_string: (str) substring of the secret name
+    :return: (str) name of the last matching secret, None if there is none
+    """
+    api = resource_util.get_resource_api(dyn_client, kind="Secret", api_version="v1")
+    for selectors in (
+        {"field_selector": f"type={SERVICE_ACCOUNT_TOKEN_TYPE}"},
+        {},
+    ):
+        secrets = api.get(
+            namespace=namespace,
+            header_params={"Accept": PARTIAL_OBJECT_METADATA_LIST},
+            **selectors,
+        )
+        names = [
+            secret.metadata.name
+            for secret in secrets.items
+            if sub_string in secret.metadata.name
+        ]
+        if names:
+            return names[-1]
+
+    return None
+
+
+def get_bearer_token_key(dyn_client, namespace, sub_string):
+    """
+    Memo key of a bearer token, tokens of different clusters are kept apart
+    """
+    configuration = getattr(dyn_client, "configuration", None)
+    cluster = getattr(configuration, "host", None) or id(dyn_client)
+    return cluster, namespace, sub_string
+
+
+def invalidate_bearer_token(
     dyn_client, namespace="default", sub_string="default-token"
 ):
     """
-    Get bearer token from secrets to authorize openshift cluster
+    Forget a memoized bearer token, e.g. after the site answered 401
+    """
+    with _bearer_tokens_lock:
+        _bearer_tokens.pop(
+            get_bearer_token_key(dyn_client, namespace, sub_string), None
+        )
+
+
+def get_long_live_bearer_token(
+    dyn_client, namespace="default", sub_string="default-token", cache=None
+):
+    """
+    Get bearer token from secrets to authorize openshift cluster. The
+    decoded token is memoized per cluster, namespace and substring for the
+    session.
     :param sub_string: (str) substring of secrets name to find actual secret name since openshift append random
     5 ascii digit at the end of every secret name
     :param namespace: (string) name of namespace where secret exist
+    :param cache: (ResourceCache) reuse cached secret lists
     :return: (string) secret token for specified secret
     """
+    key = get_bearer_token_key(dyn_client, namespace, sub_string)
+    with _bearer_tokens_lock:
+        if key in _bearer_tokens:
+            return _bearer_tokens[key]
+
     filtered_secrets = []
     try:
-        for secret in Secret.get(dyn_client=dyn_client, namespace=namespace):
-            if sub_string in secret.instance.metadata.name:
-                filtered_secrets.append(secret.instance.data.token)
+        if cache is not None:
+            for secret in cache.list("Secret", "v1", namespace):
+                if sub_string in secret.metadata.name:
+                    filtered_secrets.append(secret.data.token)
+        else:
+            secret_name = find_secret_name(dyn_client, namespace, sub_string)
+            if secret_name:
+                secret = resource_util.get_resource_api(
+                    dyn_client, kind="Secret", api_version="v1"
+                ).get(name=secret_name, namespace=namespace)
+                filtered_secrets.append(secret.data.token)
     except StopIteration:
         logger.exception(
             "Specified substring %s doesn't exist in namespace %s",
@@ -78,25 +162,56 @@ def get_long_live_bearer_token(
     # Decode base64 string into byte and convert byte to str
     if len(filtered_secrets) > 0:
         bearer_token = base64.b64decode(filtered_secrets[-1]).decode()
+        with _bearer_tokens_lock:
+            _bearer_tokens[key] = bearer_token
         return bearer_token
     else:
         return None
 
 
-def get_site_response(site_url, bearer_token):
+def get_http_session():
+    """
+    Get the HTTP session shared by the site checks. Connections are kept
+    alive and requests are retried with backoff on connection errors and 5xx
+    responses.
+    :return: (requests.Session) shared session
+    """
+    global _http_session
+
+    with _http_session_lock:
+        if _http_session is None:
+            # Suppress only the single warning from urllib3 needed.
+            requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(500, 502, 503, 504),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(max_retries=retry, pool_maxsize=16)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+
+    return _http_session
+
+
+def get_site_response(site_url, bearer_token, timeout=HTTP_TIMEOUT):
     """
 
     :param site_url: (str) Site API end point
     :param bearer_token: (str) bearer token
+    :param timeout: (tuple) connect and read timeouts in seconds
     :return: (dict) site_response
     """
     site_response = None
     headers = {"Authorization": "Bearer " + bearer_token}
 
     try:
-        # Suppress only the single warning from urllib3 needed.
-        requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
-        site_response = requests.get(site_url, headers=headers, verify=False)
+        site_response = get_http_session().get(
+            site_url, headers=headers, verify=False, timeout=timeout
+        )
     except (ConnectionError, HTTPError, RequestException) as e:
         logger.exception(
             "Failed to connect %s due to refused connection or unsuccessful status code %s",
@@ -108,6 +223,23 @@ def get_site_response(site_url, bearer_token):
     return site_response
 
 
+def probe_sites(site_urls, bearer_token, max_workers=8, timeout=HTTP_TIMEOUT):
+    """
+    Get the responses of several sites concurrently
+    :param site_urls: (list) site end points
+    :param bearer_token: (str) bearer token
+    :param max_workers: (int) number of concurrent requests
+    :param timeout: (tuple) connect and read timeouts in seconds
+    :return: (dict) site_response by site url
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = executor.map(
+            lambda site_url: get_site_response(site_url, bearer_token, timeout),
+            site_urls,
+        )
+        return dict(zip(site_urls, responses))
+
+
 def execute_shell_command_local(cmd):
     """
     Executes a shell command in a subprocess, wait until it has completed.
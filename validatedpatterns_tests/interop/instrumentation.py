@@ -0,0 +1,340 @@
+"""
+Instrumentation of the calls to the Kubernetes API server and of the oc
+commands. Calls are recorded by verb, kind and namespace and attributed to
+the running test once the recorder is enabled, e.g. with the --api-stats
+option of conftest_openshift.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from . import __loggername__
+from .current_test import get_current_test_name
+
+logger = logging.getLogger(__loggername__)
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STREAMING_SUBRESOURCES = ("log", "exec", "attach", "portforward", "proxy")
+VERBS = {"POST": "create", "PUT": "replace", "PATCH": "patch", "DELETE": "delete"}
+
+
+class CallStats(object):
+    """
+    Aggregated calls of one verb, kind and namespace
+    """
+
+    __slots__ = ("calls", "errors", "objects", "bytes", "total", "max", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.objects = 0
+        self.bytes = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, objects, nbytes, latency, error=False):
+        self.calls += 1
+        self.errors += int(error)
+        self.objects += objects
+        self.bytes += nbytes
+        self.total += latency
+        self.max = max(self.max, latency)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                break
+        else:
+            index = len(LATENCY_BUCKETS)
+        self.histogram[index] += 1
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.objects += other.objects
+        self.bytes += other.bytes
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def percentile(self, fraction):
+        """
+        :return: (float) upper bound of the histogram bucket of the percentile,
+        the maximum latency for the last bucket
+        """
+        rank = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                if index < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[index], self.max)
+                break
+        return self.max
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "objects": self.objects,
+            "bytes": self.bytes,
+            "total_seconds": round(self.total, 6),
+            "max_seconds": round(self.max, 6),
+            "p50_seconds": round(self.percentile(0.5), 6),
+            "p95_seconds": round(self.percentile(0.95), 6),
+            "histogram": dict(
+                zip(
+                    [f"le_{bound}" for bound in LATENCY_BUCKETS] + ["inf"],
+                    self.histogram,
+                )
+            ),
+        }
+
+
+class ApiRecorder(object):
+    """
+    Thread safe recorder of API calls and commands by test
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, verb, kind, namespace, objects, nbytes, latency, error=False):
+        key = (get_current_test_name(), verb, kind, namespace or "")
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CallStats()
+            stats.add(objects, nbytes, latency, error)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def _aggregate(self, by_test):
+        with self._lock:
+            items = list(self._stats.items())
+
+        aggregated = {}
+        for (test, verb, kind, namespace), stats in items:
+            key = (test, verb, kind, namespace) if by_test else (verb, kind)
+            if key not in aggregated:
+                aggregated[key] = CallStats()
+            aggregated[key].merge(stats)
+        return aggregated
+
+    def summary(self):
+        """
+        :return: (dict) call statistics of the session by verb and kind, and of
+        every test by verb, kind and namespace
+        """
+        tests = {}
+        for (test, verb, kind, namespace), stats in sorted(
+            self._aggregate(by_test=True).items()
+        ):
+            tests.setdefault(test, []).append(
+                dict(verb=verb, kind=kind, namespace=namespace, **stats.to_dict())
+            )
+
+        session = [
+            dict(verb=verb, kind=kind, **stats.to_dict())
+            for (verb, kind), stats in sorted(
+                self._aggregate(by_test=False).items(),
+                key=lambda item: item[1].total,
+                reverse=True,
+            )
+        ]
+        return {"session": session, "tests": tests}
+
+    def write_json(self, path):
+        """
+        Write the summary to a JSON file
+        :param path: (str) file path
+        """
+        with open(path, "w") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+        logger.info(f"API call summary written to {path}")
+
+    def format_table(self, limit=20):
+        """
+        :param limit: (int) number of rows, by total latency
+        :return: (list) lines of the session summary table
+        """
+        header = (
+            f"{'verb':<8} {'kind':<36} {'calls':>6} {'errors':>6} {'objects':>8} "
+            f"{'bytes':>11} {'total s':>9} {'p50 s':>7} {'p95 s':>7} {'max s':>7}"
+        )
+        lines = [header, "-" * len(header)]
+        for row in self.summary()["session"][:limit]:
+            lines.append(
+                f"{row['verb']:<8} {row['kind'][:36]:<36} {row['calls']:>6} "
+                f"{row['errors']:>6} {row['objects']:>8} {row['bytes']:>11} "
+                f"{row['total_seconds']:>9.3f} {row['p50_seconds']:>7.3f} "
+                f"{row['p95_seconds']:>7.3f} {row['max_seconds']:>7.3f}"
+            )
+        return lines
+
+
+recorder = ApiRecorder()
+
+
+def parse_api_url(method, url, query_params=None):
+    """
+    Get the verb, kind, namespace and subresource of an API request
+    :param method: (str) HTTP method
+    :param url: (str) request url
+    :param query_params: (list) query parameters as (name, value) tuples
+    :return: (tuple) verb, kind, namespace, subresource
+    """
+    split_url = urlsplit(url)
+    params = dict(parse_qsl(split_url.query))
+    params.update((str(name), str(value)) for name, value in query_params or [])
+
+    parts = [part for part in split_url.path.split("/") if part]
+    if parts[:1] == ["api"]:
+        parts = parts[2:]
+    elif parts[:1] == ["apis"]:
+        parts = parts[3:]
+
+    namespace = None
+    if len(parts) > 2 and parts[0] == "namespaces":
+        namespace = parts[1]
+        parts = parts[2:]
+
+    kind = parts[0] if parts else split_url.path
+    name = parts[1] if len(parts) > 1 else None
+    subresource = parts[2] if len(parts) > 2 else None
+    if subresource:
+        kind = f"{kind}/{subresource}"
+
+    if params.get("watch", "").lower() == "true":
+        verb = "watch"
+    elif method.upper() == "GET":
+        verb = "get" if name else "list"
+    else:
+        verb = VERBS.get(method.upper(), method.lower())
+    return verb, kind, namespace, subresource
+
+
+def _count_objects(verb, data):
+    if verb != "list":
+        return 1
+    try:
+        return len(json.loads(data).get("items") or [])
+    except (ValueError, AttributeError):
+        return 0
+
+
+def instrument_api_client(api_client, api_recorder=None):
+    """
+    Record the requests of a kubernetes api client, and so of the dynamic
+    clients and typed APIs built on it, while the recorder is enabled
+    :param api_client: (ApiClient) kubernetes api client
+    :param api_recorder: (ApiRecorder) recorder, defaults to the module one
+    :return: (ApiClient) the instrumented api client
+    """
+    api_recorder = api_recorder or recorder
+    if getattr(api_client, "_api_recorder", None) is not None:
+        return api_client
+
+    original_request = api_client.request
+
+    def request(
+        method,
+        url,
+        query_params=None,
+        headers=None,
+        post_params=None,
+        body=None,
+        _preload_content=True,
+        _request_timeout=None,
+    ):
+        if not api_recorder.enabled:
+            return original_request(
+                method,
+                url,
+                query_params,
+                headers,
+                post_params,
+                body,
+                _preload_content,
+                _request_timeout,
+            )
+
+        verb, kind, namespace, subresource = parse_api_url(method, url, query_params)
+        start = time.time()
+        try:
+            response = original_request(
+                method,
+                url,
+                query_params,
+                headers,
+                post_params,
+                body,
+                _preload_content,
+                _request_timeout,
+            )
+        except Exception:
+            api_recorder.record(verb, kind, namespace, 0, 0, time.time() - start, True)
+            raise
+        latency = time.time() - start
+
+        objects = nbytes = 0
+        if verb != "watch" and (
+            _preload_content or subresource not in STREAMING_SUBRESOURCES
+        ):
+            # Unread bodies are read here once and cached by urllib3
+            data = response.data or b""
+            nbytes = len(data)
+            objects = _count_objects(verb, data)
+        api_recorder.record(verb, kind, namespace, objects, nbytes, latency)
+        return response
+
+    api_client.request = request
+    api_client._api_recorder = api_recorder
+    return api_client
+
+
+def run_command(cmd, **kwargs):
+    """
+    subprocess.run recording the command while the recorder is enabled
+    :param cmd: (list or str) command, e.g. ["oc", "get", "pvc", "-A"]
+    :return: (CompletedProcess) result of the command
+    """
+    if not recorder.enabled:
+        return subprocess.run(cmd, **kwargs)
+
+    # Only labels the record, shell strings are not parsed
+    args = cmd.split() if isinstance(cmd, str) else list(cmd)
+    verb = os.path.basename(args[0]) if args else "exec"
+    kind = args[1] if len(args) > 1 else ""
+    namespace = None
+    for option in ("-n", "--namespace"):
+        if option in args[:-1]:
+            namespace = args[args.index(option) + 1]
+
+    start = time.time()
+    try:
+        result = subprocess.run(cmd, **kwargs)
+    except Exception:
+        recorder.record(verb, kind, namespace, 0, 0, time.time() - start, True)
+        raise
+
+    nbytes = sum(len(output or b"") for output in (result.stdout, result.stderr))
+    recorder.record(
+        verb,
+        kind,
+        namespace,
+        1,
+        nbytes,
+        time.time() - start,
+        result.returncode != 0,
+    )
+    return result
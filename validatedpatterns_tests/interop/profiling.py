@@ -0,0 +1,177 @@
+"""
+Profiling of the test bodies, enabled with the --vp-profile option of
+conftest_openshift. Every test gets a cProfile .prof file, and the stacks of
+all threads are sampled into one collapsed-stack file for flame graphs.
+
+cProfile only sees the thread running the test, the work of thread pools
+only shows up in the sampled stacks. In cpu mode the samples are weighted
+by the CPU time of their thread in microseconds so idle threads are left
+out, in wall mode every sample counts one.
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from . import __loggername__
+
+logger = logging.getLogger(__loggername__)
+
+PROFILE_MODES = ("cpu", "wall")
+PROFILE_FILTER = (
+    r"validatedpatterns_tests|kubernetes|openshift|ocp_resources|urllib3|yaml|json"
+)
+SAMPLE_INTERVAL = 0.005
+
+
+def get_thread_cpu_time(thread_id):
+    """
+    :param thread_id: (int) thread identifier
+    :return: (float) CPU time of the thread in seconds, None if not available
+    """
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+class StackSampler(object):
+    """
+    Sample the stacks of all threads from a background thread
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, cpu=False):
+        """
+        :param interval: (float) sampling interval in seconds
+        :param cpu: (bool) weight the samples by the CPU time of their thread
+        and skip the idle threads
+        """
+        self.interval = interval
+        self.cpu = cpu
+        self.stacks = collections.Counter()
+        self._cpu_times = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _weight(self, thread_id):
+        if not self.cpu:
+            return 1
+
+        cpu_time = get_thread_cpu_time(thread_id)
+        if cpu_time is None:
+            return 1
+        previous = self._cpu_times.get(thread_id, cpu_time)
+        self._cpu_times[thread_id] = cpu_time
+        return int((cpu_time - previous) * 1000000)
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                weight = self._weight(thread_id)
+                if weight <= 0:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += weight
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class SessionProfiler(object):
+    """
+    Profile test bodies into per test .prof files and a session collapsed-stack
+    file under profile_dir
+    """
+
+    def __init__(self, mode, profile_dir, interval=SAMPLE_INTERVAL):
+        """
+        :param mode: (str) cpu to measure process time, wall for wall time
+        :param profile_dir: (str) output directory
+        :param interval: (float) stack sampling interval in seconds
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid profile mode {mode}, expected {PROFILE_MODES}")
+        self.mode = mode
+        self.profile_dir = profile_dir
+        self.interval = interval
+        self.profile_files = []
+        self.stacks = collections.Counter()
+        os.makedirs(profile_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def profile(self, test_id):
+        """
+        Profile the body of a test
+        :param test_id: (str) pytest node id of the test
+        """
+        timer = time.process_time if self.mode == "cpu" else time.perf_counter
+        profile = cProfile.Profile(timer)
+        sampler = StackSampler(self.interval, cpu=self.mode == "cpu")
+
+        sampler.start()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            sampler.stop()
+
+            safe_name = re.sub(r"[^\w.-]", "_", test_id)
+            profile_path = os.path.join(self.profile_dir, f"{safe_name}.prof")
+            profile.dump_stats(profile_path)
+            # A rerun test overwrites its profile, load it only once
+            if profile_path not in self.profile_files:
+                self.profile_files.append(profile_path)
+            for stack, count in sampler.stacks.items():
+                self.stacks[(safe_name,) + stack] += count
+            logger.debug(f"Profile of {test_id} written to {profile_path}")
+
+    def write_collapsed(self):
+        """
+        Write the sampled stacks of the session in collapsed format
+        :return: (str) file path
+        """
+        datestring = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
+        collapsed_path = os.path.join(
+            self.profile_dir, f"stacks_{datestring}.collapsed"
+        )
+        with open(collapsed_path, "w") as collapsed_file:
+            for stack, count in sorted(self.stacks.items()):
+                collapsed_file.write(f"{';'.join(stack)} {count}\n")
+        return collapsed_path
+
+    def format_top(self, top=20, sort="tottime"):
+        """
+        :param top: (int) number of functions
+        :param sort: (str) pstats sort key
+        :return: (list) lines of the hottest functions of the package and its
+        dependencies over all tests
+        """
+        if not self.profile_files:
+            return []
+
+        output = io.StringIO()
+        stats = pstats.Stats(*self.profile_files, stream=output)
+        stats.sort_stats(sort).print_stats(PROFILE_FILTER, top)
+        return output.getvalue().splitlines()
@@ -0,0 +1,159 @@
+import json
+import logging
+import time
+
+from kubernetes.client.rest import ApiException
+
+from . import __loggername__
+
+logger = logging.getLogger(__loggername__)
+
+
+def get_resource_api(dyn_client, kind, api_version=None, group=None):
+    """
+    Resolve the dynamic client API for a kind
+    :param dyn_client: (DynamicClient) openshift dynamic client
+    :param kind: (str) resource kind, e.g. Pod
+    :param api_version: (str) full api version, e.g. v1 or tekton.dev/v1
+    :param group: (str) api group, used to pick the preferred version when
+    api_version is not given
+    :return: (Resource) dynamic client resource API
+    """
+    if api_version:
+        return dyn_client.resources.get(api_version=api_version, kind=kind)
+
+    apis = dyn_client.resources.search(group=group, kind=kind)
+    preferred = [api for api in apis if getattr(api, "preferred", False)]
+    if preferred:
+        return preferred[0]
+    return dyn_client.resources.get(group=group, kind=kind)
+
+
+def list_resources(
+    dyn_client, kind, api_version, namespace=None, cache=None, **selectors
+):
+    """
+    List resource instances of a kind
+    :param dyn_client: (DynamicClient) openshift dynamic client
+    :param kind: (str) resource kind
+    :param api_version: (str) api version of the kind
+    :param namespace: (str) namespace, None for all namespaces
+    :param cache: (ResourceCache) reuse cached list results
+    :param selectors: label_selector / field_selector
+    :return: (list) resource instances
+    """
+    if cache is not None:
+        return cache.list(kind, api_version, namespace, **selectors)
+
+    api = get_resource_api(dyn_client, kind=kind, api_version=api_version)
+    return api.get(namespace=namespace, **selectors).items
+
+
+def iter_raw_items(api, namespace=None, limit=500, **selectors):
+    """
+    Yield the items of a paginated list as plain dicts, without building
+    ResourceInstance objects
+    :param api: (Resource) dynamic client resource API
+    :param namespace: (str) namespace, None for all namespaces
+    :param limit: (int) page size
+    :param selectors: label_selector / field_selector
+    """
+    continue_token = None
+    while True:
+        params = dict(selectors, limit=limit)
+        if continue_token:
+            params["_continue"] = continue_token
+        response = api.get(namespace=namespace, serialize=False, **params)
+        page = json.loads(response.data)
+
+        for item in page.get("items") or []:
+            yield item
+
+        continue_token = (page.get("metadata") or {}).get("continue")
+        if not continue_token:
+            break
+
+
+def index_by_name(items):
+    """
+    Index resource instances by name and namespace
+    :param items: (list) resource instances
+    :return: (dict) resource instances by (name, namespace)
+    """
+    return {(item.metadata.name, item.metadata.namespace): item for item in items}
+
+
+def list_and_watch(
+    api,
+    namespace=None,
+    timeout=3600,
+    watch_timeout=300,
+    idle_events=False,
+    **selectors,
+):
+    """
+    Yield (event_type, object) for an initial list of the resources followed by
+    watch events from the list resourceVersion until timeout expires. Listed
+    objects are reported as ADDED. The watch is re-established from the last
+    seen resourceVersion and a fresh list is issued when it has expired, the
+    objects missing from the fresh list are reported as DELETED.
+    The caller stops waiting by breaking out of the loop.
+    :param api: (Resource) dynamic client resource API
+    :param namespace: (str) namespace to watch, None for all namespaces
+    :param timeout: (int) overall time budget in seconds
+    :param watch_timeout: (int) server side timeout of a single watch request
+    :param idle_events: (bool) yield ("IDLE", None) when a watch request ends
+    without events, so the caller can check its own deadlines
+    :param selectors: label_selector / field_selector passed to list and watch
+    """
+    deadline = time.time() + timeout
+    resource_version = None
+    known = {}
+
+    while time.time() < deadline:
+        if resource_version is None:
+            listing = api.get(namespace=namespace, **selectors)
+            resource_version = listing.metadata.resourceVersion
+            listed = {}
+            for item in listing.items:
+                listed[(item.metadata.namespace, item.metadata.name)] = item
+                yield "ADDED", item
+            # Deletions missed while the watch was expired
+            for key in [key for key in known if key not in listed]:
+                yield "DELETED", known[key]
+            known = listed
+
+        remaining = int(deadline - time.time())
+        if remaining <= 0:
+            break
+
+        got_events = False
+        try:
+            for event in api.watch(
+                namespace=namespace,
+                resource_version=resource_version,
+                timeout=min(remaining, watch_timeout),
+                **selectors,
+            ):
+                if event["type"] == "ERROR":
+                    logger.info(f"Watch expired, relisting: {event['raw_object']}")
+                    resource_version = None
+                    break
+                got_events = True
+                obj = event["object"]
+                resource_version = obj.metadata.resourceVersion
+                key = (obj.metadata.namespace, obj.metadata.name)
+                if event["type"] == "DELETED":
+                    known.pop(key, None)
+                else:
+                    known[key] = obj
+                yield event["type"], obj
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            logger.info("Watch resourceVersion is too old, relisting")
+            resource_version = None
+            continue
+
+        if idle_events and not got_events and resource_version is not None:
+            yield "IDLE", None
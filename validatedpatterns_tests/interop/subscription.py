@@ -1,17 +1,23 @@
 import difflib
+import json
 import logging
 import os
 import re
-import subprocess
+import time
 
 from ocp_resources.cluster_version import ClusterVersion
 from ocp_resources.subscription import Subscription
 from openshift.dynamic.exceptions import NotFoundError
 
-from . import __loggername__
+from . import __loggername__, resource_util
+from .baseline_store import get_baseline_store
 
 logger = logging.getLogger(__loggername__)
 
+SUBSCRIPTION_API_VERSION = "operators.coreos.com/v1alpha1"
+
+CSV_NAME_RE = re.compile(r"^(?P<name>.+?)\.(?P<version>v?\d.*)$")
+
 
 def openshift_version(openshift_dyn_client):
     versions = ClusterVersion.get(dyn_client=openshift_dyn_client)
@@ -21,57 +27,231 @@ def openshift_version(openshift_dyn_client):
     return version
 
 
-def subscription_status(openshift_dyn_client, expected_subs, diff):
+def get_subscription_index(openshift_dyn_client, namespaces=None, cache=None):
+    """
+    List subscriptions once and index them by name and namespace
+    :param namespaces: (list) namespaces listed one by one, None lists the
+    subscriptions of all namespaces with a single call
+    :param cache: (ResourceCache) reuse cached subscription lists
+    :return: (dict) subscription instances by (name, namespace)
+    """
+    if namespaces is None:
+        namespaces = [None]
+
+    return resource_util.index_by_name(
+        [
+            sub
+            for namespace in namespaces
+            for sub in resource_util.list_resources(
+                openshift_dyn_client,
+                "Subscription",
+                SUBSCRIPTION_API_VERSION,
+                namespace=namespace,
+                cache=cache,
+            )
+        ]
+    )
+
+
+def get_operator_health(
+    openshift_dyn_client, expected_subs=None, cache=None, sub_index=None
+):
+    """
+    List subscriptions, install plans and cluster service versions once each
+    and join them by reference to report the health of every operator
+    :param expected_subs: (dict) namespaces of the subscriptions by name to
+    restrict the report to, None reports all subscriptions
+    :param cache: (ResourceCache) reuse cached list results
+    :param sub_index: (dict) subscriptions by (name, namespace) already listed
+    by the caller, listed here otherwise
+    :return: (dict) operator health records by (name, namespace)
+    """
+    if sub_index is None:
+        sub_index = get_subscription_index(openshift_dyn_client, cache=cache)
+    installplans = resource_util.index_by_name(
+        resource_util.list_resources(
+            openshift_dyn_client,
+            "InstallPlan",
+            SUBSCRIPTION_API_VERSION,
+            cache=cache,
+        )
+    )
+    # Copied CSVs of operators watching all namespaces are skipped
+    csvs = resource_util.index_by_name(
+        resource_util.list_resources(
+            openshift_dyn_client,
+            "ClusterServiceVersion",
+            SUBSCRIPTION_API_VERSION,
+            cache=cache,
+            label_selector="!olm.copiedFrom",
+        )
+    )
+
+    health = {}
+    for (name, namespace), sub in sub_index.items():
+        if expected_subs is not None and namespace not in expected_subs.get(name, []):
+            continue
+
+        status = sub.status
+        installplan_ref = status.installPlanRef if status else None
+        installplan = (
+            installplans.get((installplan_ref.name, installplan_ref.namespace))
+            if installplan_ref
+            else None
+        )
+        installed_csv = status.installedCSV if status else None
+        csv = csvs.get((installed_csv, namespace)) if installed_csv else None
+        catalog_sources_unhealthy = next(
+            (
+                condition.status
+                for condition in (status.conditions if status else None) or []
+                if condition.type == "CatalogSourcesUnhealthy"
+            ),
+            None,
+        )
+
+        record = {
+            "state": status.state if status else None,
+            "catalogSourcesUnhealthy": catalog_sources_unhealthy,
+            "installPlan": installplan_ref.name if installplan_ref else None,
+            "installPlanPhase": installplan.status.phase if installplan else None,
+            "installedCSV": installed_csv,
+            "csvPhase": csv.status.phase if csv else None,
+        }
+        record["healthy"] = (
+            record["catalogSourcesUnhealthy"] != "True"
+            and record["installPlanPhase"] == "Complete"
+            and record["csvPhase"] == "Succeeded"
+        )
+        health[(name, namespace)] = record
+
+    return health
+
+
+def subscription_status(
+    openshift_dyn_client,
+    expected_subs,
+    diff,
+    snapshot=None,
+    verify_installs=False,
+    baseline_store=None,
+    cache=None,
+    publish_baseline=None,
+):
+    """
+    Check the state of the expected operator subscriptions
+    :param expected_subs: (dict) namespaces of the subscriptions by name
+    :param diff: (bool) diff the installed operator versions with the baseline
+    :param snapshot: (str) "cluster" to list the subscriptions of all
+    namespaces with a single call, "namespace" to list them once per distinct
+    namespace, instead of one lookup per subscription
+    :param verify_installs: (bool) also check that the referenced install plan
+    is Complete and the installed CSV reached Succeeded
+    :param baseline_store: store of the operator versions baseline, defaults
+    to the one configured by the environment (see get_baseline_store)
+    :param cache: (ResourceCache) reuse cached subscription lists for the
+    snapshot and install verification
+    :param publish_baseline: (bool) write and publish the new operator versions
+    baseline when the check passes, e.g. push it to the git repository.
+    Defaults to OPERATOR_VERSIONS_PUBLISH=true in the environment.
+    :return: None on success, err_msg otherwise
+    """
+    start = time.time()
     operator_versions = []
     missing_subs = []
     unhealthy_subs = []
     missing_installplans = []
     upgrades_pending = []
+    incomplete_installplans = []
+    failed_csvs = []
+
+    sub_index = None
+    if snapshot == "cluster":
+        sub_index = get_subscription_index(openshift_dyn_client, cache=cache)
+    elif snapshot:
+        namespaces = sorted({val for vals in expected_subs.values() for val in vals})
+        sub_index = get_subscription_index(openshift_dyn_client, namespaces, cache)
 
     for key in expected_subs.keys():
         for val in expected_subs[key]:
-            try:
-                subs = Subscription.get(
-                    dyn_client=openshift_dyn_client, name=key, namespace=val
-                )
-                sub = next(subs)
-            except NotFoundError:
-                missing_subs.append(f"{key} in {val} namespace")
-                continue
+            if sub_index is not None:
+                sub = sub_index.get((key, val))
+                if sub is None:
+                    missing_subs.append(f"{key} in {val} namespace")
+                    continue
+            else:
+                try:
+                    subs = Subscription.get(
+                        dyn_client=openshift_dyn_client, name=key, namespace=val
+                    )
+                    sub = next(subs).instance
+                except NotFoundError:
+                    missing_subs.append(f"{key} in {val} namespace")
+                    continue
 
+            extra = {
+                "namespace": sub.metadata.namespace,
+                "kind": "Subscription",
+                "resource": sub.metadata.name,
+            }
             logger.info(
-                f"State for {sub.instance.metadata.name}: {sub.instance.status.state}"
+                f"State for {sub.metadata.name}: {sub.status.state}", extra=extra
             )
-            if sub.instance.status.state == "UpgradePending":
+            if sub.status.state == "UpgradePending":
                 upgrades_pending.append(
-                    f"{sub.instance.metadata.name} in {sub.instance.metadata.namespace} namespace"
+                    f"{sub.metadata.name} in {sub.metadata.namespace} namespace"
                 )
 
             logger.info(
-                f"CatalogSourcesUnhealthy: {sub.instance.status.conditions[0].status}"
+                f"CatalogSourcesUnhealthy: {sub.status.conditions[0].status}",
+                extra=extra,
             )
-            if sub.instance.status.conditions[0].status != "False":
-                logger.info(f"Subscription {sub.instance.metadata.name} is unhealthy")
+            if sub.status.conditions[0].status != "False":
+                logger.info(
+                    f"Subscription {sub.metadata.name} is unhealthy", extra=extra
+                )
                 unhealthy_subs.append(
-                    f"{sub.instance.metadata.name} in {sub.instance.metadata.namespace} namespace"
+                    f"{sub.metadata.name} in {sub.metadata.namespace} namespace"
                 )
             else:
-                operator_versions.append(
-                    f"installedCSV: {sub.instance.status.installedCSV}"
-                )
+                operator_versions.append(f"installedCSV: {sub.status.installedCSV}")
 
-            logger.info(f"installPlanRef: {sub.instance.status.installPlanRef}")
-            if not sub.instance.status.installPlanRef:
+            logger.info(f"installPlanRef: {sub.status.installPlanRef}", extra=extra)
+            if not sub.status.installPlanRef:
                 logger.info(
-                    f"No install plan found for subscription {sub.instance.metadata.name} "
-                    f"in {sub.instance.metadata.namespace} namespace"
+                    f"No install plan found for subscription {sub.metadata.name} "
+                    f"in {sub.metadata.namespace} namespace",
+                    extra=extra,
                 )
                 missing_installplans.append(
-                    f"{sub.instance.metadata.name} in {sub.instance.metadata.namespace} namespace"
+                    f"{sub.metadata.name} in {sub.metadata.namespace} namespace"
                 )
 
             logger.info("")
 
+    if verify_installs:
+        operator_health = get_operator_health(
+            openshift_dyn_client, expected_subs, cache, sub_index
+        )
+        for (name, namespace), record in operator_health.items():
+            logger.info(
+                f"Operator health for {name} in {namespace}: {record}",
+                extra={
+                    "namespace": namespace,
+                    "kind": "Subscription",
+                    "resource": name,
+                },
+            )
+            if record["installPlan"] and record["installPlanPhase"] != "Complete":
+                incomplete_installplans.append(f"{name} in {namespace} namespace")
+            if record["csvPhase"] != "Succeeded":
+                failed_csvs.append(f"{name} in {namespace} namespace")
+
+    logger.info(
+        f"Checked {sum(len(vals) for vals in expected_subs.values())} subscriptions",
+        extra={"kind": "Subscription", "duration": time.time() - start},
+    )
+
     if missing_subs:
         logger.error(f"FAIL: The following subscriptions are missing: {missing_subs}")
     if unhealthy_subs:
@@ -86,6 +266,14 @@ def subscription_status(openshift_dyn_client, expected_subs, diff):
         logger.error(
             f"FAIL: The following subscriptions are in UpgradePending state: {upgrades_pending}"
         )
+    if incomplete_installplans:
+        logger.error(
+            f"FAIL: The install plan for the following subscriptions is not complete: {incomplete_installplans}"
+        )
+    if failed_csvs:
+        logger.error(
+            f"FAIL: The installed CSV for the following subscriptions has not succeeded: {failed_csvs}"
+        )
 
     cluster_version = openshift_version(openshift_dyn_client)
     logger.info(f"Openshift version:\n{cluster_version.instance.status.history}")
@@ -99,65 +287,112 @@ def subscription_status(openshift_dyn_client, expected_subs, diff):
             print(line, file=sourceFile)
         sourceFile.close()
 
-        logger.info("Clone operator-versions repo")
-        try:
-            operator_versions_repo = (
-                "git@gitlab.cee.redhat.com:mpqe/mps/vp/operator-versions.git"
-            )
-            clone = subprocess.run(
-                ["git", "clone", operator_versions_repo], capture_output=True, text=True
-            )
-            logger.info(clone.stdout)
-            logger.info(clone.stderr)
-        except Exception:
-            pass
+        if baseline_store is None:
+            baseline_store = get_baseline_store()
 
         pattern = os.getenv("PATTERN_SHORTNAME")
-        previouspath = os.getcwd() + f"/operator-versions/{pattern}_hub_{shortversion}"
         previousfile = f"{pattern}_hub_{shortversion}"
+        current_lines = [f"{line}\n" for line in operator_versions]
 
         logger.info("Ensure previous file exists")
-        checkpath = os.path.exists(previouspath)
+        previous_lines = baseline_store.read(previousfile)
+        checkpath = previous_lines is not None
         logger.info(checkpath)
 
         if checkpath is True:
             logger.info("Diff current operator list with previous file")
-            diff = opdiff(open(previouspath).readlines(), open(currentfile).readlines())
-            diffstring = "".join(diff)
+            diff_lines = opdiff(previous_lines, current_lines)
+            diffstring = "".join(diff_lines)
             logger.info(diffstring)
 
             logger.info("Write diff to file")
             sourceFile = open("operator_diffs_hub.log", "w")
             print(diffstring, file=sourceFile)
             sourceFile.close()
+
+            keyed_diff = opdiff_keyed(previous_lines, current_lines)
+            logger.info(f"Operator version changes: {keyed_diff}")
+            with open("operator_diffs_hub.json", "w") as diff_file:
+                json.dump(keyed_diff, diff_file, indent=2)
         else:
             logger.info("Skipping operator diff - previous file not found")
 
-    if missing_subs or unhealthy_subs or missing_installplans or upgrades_pending:
+    if (
+        missing_subs
+        or unhealthy_subs
+        or missing_installplans
+        or upgrades_pending
+        or incomplete_installplans
+        or failed_csvs
+    ):
         err_msg = "Subscription status check failed"
         return err_msg
     else:
         # Only push the new operarator list if the test passed
         # and we are not testing a pre-release operator nor
         # running externally
-        if (os.getenv("EXTERNAL_TEST") != "true") and (diff == True):
+        if publish_baseline is None:
+            publish_baseline = os.getenv("OPERATOR_VERSIONS_PUBLISH") == "true"
+        if (
+            (os.getenv("EXTERNAL_TEST") != "true")
+            and (diff == True)
+            and publish_baseline
+        ):
             if checkpath is True and not os.environ["INDEX_IMAGE"]:
-                os.remove(previouspath)
-                os.rename(currentfile, previouspath)
-
-                cwd = os.getcwd() + "/operator-versions"
-                logger.info(f"CWD: {cwd}")
-
-                logger.info("Push new operator list")
-                subprocess.run(["git", "add", previousfile], cwd=cwd)
-                subprocess.run(
-                    ["git", "commit", "-m", "Update operator versions list"],
-                    cwd=cwd,
-                )
-                subprocess.run(["git", "push"], cwd=cwd)
+                baseline_store.write(previousfile, current_lines)
+                baseline_store.publish(previousfile, "Update operator versions list")
 
         return None
 
 
 def opdiff(*args):
     return filter(lambda x: not x.startswith(" "), difflib.ndiff(*args))
+
+
+def parse_operator_versions(lines):
+    """
+    Parse "installedCSV: <name>.<version>" lines
+    :param lines: (list) operator version lines
+    :return: (dict) versions by operator name
+    """
+    operators = {}
+    for line in lines:
+        csv_name = line.split(":", 1)[-1].strip()
+        if not csv_name:
+            continue
+        match = CSV_NAME_RE.match(csv_name)
+        if match:
+            operators[match.group("name")] = match.group("version")
+        else:
+            operators[csv_name] = None
+
+    return operators
+
+
+def opdiff_keyed(baseline, current):
+    """
+    Compare operator versions by operator name
+    :param baseline: (list) operator version lines of the baseline
+    :param current: (list) operator version lines of the current run
+    :return: (dict) added, removed and upgraded operators
+    """
+    previous_versions = parse_operator_versions(baseline)
+    current_versions = parse_operator_versions(current)
+
+    return {
+        "added": [
+            {"name": name, "version": version}
+            for name, version in current_versions.items()
+            if name not in previous_versions
+        ],
+        "removed": [
+            {"name": name, "version": version}
+            for name, version in previous_versions.items()
+            if name not in current_versions
+        ],
+        "upgraded": [
+            {"name": name, "from": previous_versions[name], "to": version}
+            for name, version in current_versions.items()
+            if name in previous_versions and previous_versions[name] != version
+        ],
+    }
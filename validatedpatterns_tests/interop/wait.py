@@ -0,0 +1,234 @@
+import logging
+import random
+import time
+
+from kubernetes.client.rest import ApiException
+
+from . import __loggername__, resource_util
+
+logger = logging.getLogger(__loggername__)
+
+
+class WaitResult(object):
+    """
+    Outcome of wait_for. Evaluates to True when the condition was met.
+    """
+
+    __slots__ = ("success", "objects", "error", "elapsed", "timed_out")
+
+    def __init__(self, success, objects, error, elapsed, timed_out=False):
+        """
+        :param success: (bool) the condition was met
+        :param objects: (dict) last seen objects by (namespace, name)
+        :param error: (str) failure or timeout message, None on success
+        :param elapsed: (float) seconds spent waiting
+        :param timed_out: (bool) the time budget expired
+        """
+        self.success = success
+        self.objects = objects
+        self.error = error
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return (
+            f"WaitResult(success={self.success}, objects={len(self.objects)}, "
+            f"error={self.error!r}, elapsed={self.elapsed:.1f})"
+        )
+
+
+def get_backoff(attempt, interval, max_interval):
+    """
+    Exponential backoff with full jitter
+    :param attempt: (int) number of polls without change
+    :param interval: (float) first poll interval in seconds
+    :param max_interval: (float) maximum poll interval in seconds
+    :return: (float) seconds to sleep
+    """
+    return random.uniform(interval / 2, min(max_interval, interval * 2**attempt))
+
+
+def is_retryable(error):
+    """
+    :param error: (ApiException) failed API call
+    :return: (bool) the call may succeed later: expired resource version, rate
+    limiting or server error
+    """
+    return not error.status or error.status in (410, 429) or error.status >= 500
+
+
+def _object_key(obj):
+    return obj.metadata.namespace, obj.metadata.name
+
+
+def _update(objects, event_type, obj, match, progress):
+    """
+    Apply an event to the tracked objects
+    :return: (bool) the tracked objects changed
+    """
+    if match and not match(obj):
+        return False
+
+    key = _object_key(obj)
+    if event_type == "DELETED":
+        if objects.pop(key, None) is None:
+            return False
+    else:
+        previous = objects.get(key)
+        if (
+            previous is not None
+            and previous.metadata.resourceVersion == obj.metadata.resourceVersion
+        ):
+            return False
+        objects[key] = obj
+
+    if progress:
+        progress(event_type, obj, objects)
+    return True
+
+
+def _evaluate(objects, condition, fail):
+    """
+    :return: (tuple) done, error message
+    """
+    if fail:
+        error = fail(objects)
+        if error:
+            return True, error
+    return condition(objects), None
+
+
+def _poll(api, namespace, objects, match, progress, selectors):
+    """
+    List the resources and turn the differences with the tracked objects into
+    events
+    :return: (bool) the tracked objects changed
+    """
+    items = api.get(namespace=namespace, **selectors).items
+    listed = {}
+    changed = False
+
+    for item in items:
+        if match and not match(item):
+            continue
+        listed[_object_key(item)] = item
+        event_type = "MODIFIED" if _object_key(item) in objects else "ADDED"
+        changed |= _update(objects, event_type, item, None, progress)
+
+    for key in [key for key in objects if key not in listed]:
+        changed |= _update(objects, "DELETED", objects[key], None, progress)
+
+    return changed
+
+
+def wait_for(
+    dyn_client,
+    kind,
+    condition,
+    api_version=None,
+    group=None,
+    namespace=None,
+    match=None,
+    fail=None,
+    progress=None,
+    timeout=600,
+    watch=True,
+    interval=5,
+    max_interval=60,
+    **selectors,
+):
+    """
+    Wait until the resources of a kind meet a condition. The resources are
+    watched and, when the watch is not available, listed with exponential
+    backoff and jitter. The condition is evaluated on every change. List
+    errors other than 410, 429 and 5xx, e.g. 403, are raised.
+    :param dyn_client: (DynamicClient) openshift dynamic client
+    :param kind: (str) resource kind
+    :param condition: function(objects) returning True when the wait is done.
+    objects is a dict of the tracked resources by (namespace, name).
+    :param api_version: (str) api version of the kind
+    :param group: (str) api group, used when api_version is not given
+    :param namespace: (str) namespace, None for all namespaces
+    :param match: function(obj) returning True for the resources to track
+    :param fail: function(objects) returning an error message to stop waiting
+    :param progress: function(event_type, obj, objects) called on every change
+    :param timeout: (int) time budget in seconds
+    :param watch: (bool) watch the resources, list them otherwise
+    :param interval: (float) first poll interval in seconds
+    :param max_interval: (float) maximum poll interval in seconds
+    :param selectors: label_selector / field_selector
+    :return: (WaitResult) outcome of the wait
+    """
+    start = time.time()
+    deadline = start + timeout
+    objects = {}
+    api = resource_util.get_resource_api(
+        dyn_client, kind=kind, api_version=api_version, group=group
+    )
+
+    def result(success, error, timed_out=False):
+        elapsed = time.time() - start
+        logger.info(
+            f"Wait for {kind} {'done' if success else 'failed'}: {error or ''}",
+            extra={"namespace": namespace, "kind": kind, "duration": elapsed},
+        )
+        return WaitResult(success, objects, error, elapsed, timed_out)
+
+    def on_change(event_type, obj, tracked):
+        logger.debug(
+            f"{kind} {obj.metadata.name} {event_type}",
+            extra={
+                "namespace": obj.metadata.namespace,
+                "kind": kind,
+                "resource": obj.metadata.name,
+                "duration": time.time() - start,
+            },
+        )
+        if progress:
+            progress(event_type, obj, tracked)
+
+    if watch:
+        try:
+            for event_type, obj in resource_util.list_and_watch(
+                api,
+                namespace=namespace,
+                timeout=timeout,
+                watch_timeout=max(int(max_interval), 1),
+                idle_events=True,
+                **selectors,
+            ):
+                if event_type != "IDLE":
+                    _update(objects, event_type, obj, match, on_change)
+
+                done, error = _evaluate(objects, condition, fail)
+                if done:
+                    return result(error is None, error)
+        except ApiException as e:
+            logger.info(
+                f"Watch of {kind} failed, polling instead: {e.status} {e.reason}"
+            )
+
+    attempt = 0
+    while True:
+        try:
+            if _poll(api, namespace, objects, match, on_change, selectors):
+                attempt = 0
+        except ApiException as e:
+            if not is_retryable(e):
+                raise
+            logger.info(f"List of {kind} failed, retrying: {e.status} {e.reason}")
+
+        done, error = _evaluate(objects, condition, fail)
+        if done:
+            return result(error is None, error)
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        time.sleep(min(remaining, get_backoff(attempt, interval, max_interval)))
+        attempt += 1
+
+    return result(False, f"Timed out after {timeout}s waiting for {kind}", True)